@@ -1,6 +1,18 @@
-from generate_SRA_metadata import get_genome_metadata, get_transcriptome_metadata, write_file_metadata
+from batch_metadata import check_batch_options, check_shard, merge_metadata, process_metadata, process_single, shard_suffix
+from generate_SRA_metadata import load_platform_rules, set_platform_rules
+from checksums import ChecksumResolver, get_checksum_resolver, set_checksum_resolver
+from header_probe import HeaderProbe, set_header_probe
+from inventory import load_inventory
+from journal import Journal
+from listing_cache import ETagCache, ListingCache
+from profiling import profiler
+from s3_listing import configure_s3, set_listing_cache
+from service import is_loopback, serve
+from submissions import SubmissionIndex
+from validation import BatchValidator
 import argparse
-import csv
+import os
+import sys
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -10,6 +22,69 @@ def parse_args():
     parser.add_argument(
         '-tx', '--transcriptome', action = 'store_true', help = 'Generate transcriptome metadata'
     )
+    parser.add_argument(
+        '--max-connections', type = int, help = 'Size of the shared S3 connection pool (default: 10)'
+    )
+    parser.add_argument(
+        '--connect-timeout', type = float, help = 'S3 connection timeout in seconds (default: 10)'
+    )
+    parser.add_argument(
+        '--read-timeout', type = float, help = 'S3 read timeout in seconds (default: 60)'
+    )
+    parser.add_argument(
+        '-r', '--recursive', action = 'store_true', help = 'List each ToLID folder in a single recursive pass instead of one request per directory'
+    )
+    parser.add_argument(
+        '--cache-dir', help = 'Directory for the persistent S3 listing cache (disabled if not set)'
+    )
+    parser.add_argument(
+        '--cache-ttl', type = float, default = 24, help = 'Hours before a cached listing is fetched again (default: 24)'
+    )
+    parser.add_argument(
+        '--cache-max-entries', type = int, default = 1000000, help = 'Number of cached keys kept before evicting the least recently used listings (default: 1000000)'
+    )
+    parser.add_argument(
+        '--refresh', action = 'store_true', help = 'Ignore cached listings and re-list from S3, updating the cache'
+    )
+    parser.add_argument(
+        '--inventory', help = 'Bucket inventory (S3 Inventory CSV/Parquet/manifest.json or a plain key list) to read listings from instead of S3'
+    )
+    parser.add_argument(
+        '--profile', action = 'store_true', help = 'Print per-stage and per-ToLID timings, request counts and listed object sizes when done'
+    )
+    parser.add_argument(
+        '--profile-output', help = 'Also write the profile, with a Chrome trace of every timed call, to this JSON file'
+    )
+    parser.add_argument(
+        '--since-submissions', help = 'Directory of earlier submission TSVs; only files not listed there are emitted, continuing their library_ID numbering'
+    )
+    parser.add_argument(
+        '--probe-headers', action = 'store_true', help = 'Read the start of each BAM/FASTQ to take instrument models from the file headers'
+    )
+    parser.add_argument(
+        '--probe-bytes', type = int, default = 65536, help = 'Bytes fetched from the start of each probed file (default: 65536)'
+    )
+    parser.add_argument(
+        '--probe-budget', type = int, default = 1024, help = 'Total megabytes fetched by header probes in a run (default: 1024)'
+    )
+    parser.add_argument(
+        '--probe-jobs', type = int, default = 8, help = 'Number of header probes run at once (default: 8)'
+    )
+    parser.add_argument(
+        '--checksums', action = 'store_true', help = 'Add filesize and md5 columns, taken from the listing or, for multipart uploads, by streaming the object'
+    )
+    parser.add_argument(
+        '--checksum-jobs', type = int, default = 4, help = 'Number of multipart objects hashed at once (default: 4)'
+    )
+    parser.add_argument(
+        '--checksum-part-size', type = int, default = 8, help = 'Megabytes per ranged read when hashing multipart objects (default: 8)'
+    )
+    parser.add_argument(
+        '--validate', action = 'store_true', help = 'Check all rows for duplicate files, unpaired reads and library_ID collisions before writing; nothing is written if any are found'
+    )
+    parser.add_argument(
+        '--rules', help = 'JSON (or YAML) platform rule table to use instead of the bundled platform_rules.json'
+    )
     subparsers = parser.add_subparsers()
     single_entry = subparsers.add_parser('single')
     single_entry.add_argument(
@@ -25,40 +100,110 @@ def parse_args():
     batch_entry.add_argument(
         '-f', '--filename', help = '.csv file containing species information', required = True
     )
-    return parser.parse_args()
+    batch_entry.add_argument(
+        '-j', '--jobs', type = int, default = 1, help = 'Number of ToLID listings to run concurrently (default: 1)'
+    )
+    batch_entry.add_argument(
+        '-c', '--consolidate', action = 'store_true', help = 'Stream all rows into one sequence and one transcriptome TSV instead of one file per ToLID'
+    )
+    batch_entry.add_argument(
+        '--max-rows', type = int, help = 'Start a new consolidated TSV part after this many rows'
+    )
+    batch_entry.add_argument(
+        '--journal', help = 'Append each finished ToLID pass and its rows to this checkpoint journal'
+    )
+    batch_entry.add_argument(
+        '--resume', action = 'store_true', help = 'Skip passes already recorded in the journal (default journal: <output-dir>/batch_journal.jsonl)'
+    )
+    batch_entry.add_argument(
+        '-o', '--output-dir', default = 'submission_metadata', help = 'Output directory (default: submission_metadata)'
+    )
+    batch_entry.add_argument(
+        '--shard', type = parse_shard, help = 'Only process shard i of N (e.g. 2/4); ToLIDs are assigned to shards by hash'
+    )
+    serve_entry = subparsers.add_parser('serve')
+    serve_entry.add_argument(
+        '--host', type = parse_host, default = '127.0.0.1', help = 'Loopback address to listen on (default: 127.0.0.1)'
+    )
+    serve_entry.add_argument(
+        '--root', help = 'Directory that request files and output directories must lie under (default: current directory)'
+    )
+    serve_entry.add_argument(
+        '--port', type = int, default = 8765, help = 'Port to listen on (default: 8765)'
+    )
+    merge_entry = subparsers.add_parser('merge')
+    merge_entry.add_argument(
+        '-i', '--inputs', nargs = '+', help = 'Per-shard TSV files or directories containing them', required = True
+    )
+    merge_entry.add_argument(
+        '-o', '--output-dir', default = 'submission_metadata', help = 'Output directory (default: submission_metadata)'
+    )
+    merge_entry.add_argument(
+        '--max-rows', type = int, help = 'Start a new merged TSV part after this many rows'
+    )
+    args = parser.parse_args()
+    if hasattr(args, 'consolidate'):
+        try:
+            check_batch_options(args.jobs, args.max_rows, args.consolidate)
+        except ValueError as error:
+            parser.error(str(error))
+    return args
+
+def parse_shard(value):
+    try:
+        shard, shards = (int(number) for number in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('shard must look like i/N, e.g. 2/4')
+    try:
+        return check_shard(shard, shards)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
 
-def process_metadata(filename, genomic, transcriptomic):
-    species_dict = dict()
-    with open(filename, 'r', encoding='utf-8-sig') as file:
-        csv_reader = csv.DictReader(file)
-        for row in csv_reader:
-            if row['BioSample']:
-                species_dict[row['ToLID']] = {'BioSample':row['BioSample'], 'Species':row['Species']}
-    for tolid in species_dict.keys():
-        print(species_dict[tolid])
-        species= species_dict[tolid]['Species']
-        biosample_accession = species_dict[tolid]['BioSample']
-        if genomic:
-            file_metadata = get_genome_metadata(species, tolid, biosample_accession)
-            filename = f'submission_metadata/sequence_metadata/%s_%s_SRA_sequence_metadata.tsv' % (species.replace(' ', '_'), tolid)
-            if file_metadata:
-                write_file_metadata(file_metadata, filename)
-        if transcriptomic:
-            file_metadata = get_transcriptome_metadata(species, tolid, biosample_accession)
-            filename = f'submission_metadata/transcriptome_metadata/%s_%s_SRA_transcriptome_metadata.tsv' % (species.replace(' ', '_'), tolid)
-            if file_metadata:
-                write_file_metadata(file_metadata, filename)
+def parse_host(value):
+    if not is_loopback(value):
+        raise argparse.ArgumentTypeError('%s is not a loopback address; the service has no authentication' % (value))
+    return value
 
 if __name__ == '__main__':
     args = parse_args()
+    max_connections = args.max_connections
+    if max_connections is None and getattr(args, 'jobs', 1) > 10:
+        max_connections = args.jobs
+    configure_s3(max_pool_connections = max_connections, connect_timeout = args.connect_timeout, read_timeout = args.read_timeout)
+    if args.cache_dir:
+        set_listing_cache(ListingCache(args.cache_dir, ttl = args.cache_ttl * 3600, max_entries = args.cache_max_entries, refresh = args.refresh))
+    if args.probe_headers:
+        set_header_probe(HeaderProbe(bytes_per_file = args.probe_bytes, budget = args.probe_budget * 1024 * 1024, jobs = args.probe_jobs,
+                                     cache = ETagCache(args.cache_dir, 'header_probes') if args.cache_dir else None))
+    if args.checksums:
+        set_checksum_resolver(ChecksumResolver(part_size = args.checksum_part_size * 1024 * 1024, jobs = args.checksum_jobs,
+                                               cache = ETagCache(args.cache_dir, 'checksums') if args.cache_dir else None))
+    if args.rules:
+        set_platform_rules(load_platform_rules(args.rules))
+    if args.profile or args.profile_output:
+        profiler.enable(trace = bool(args.profile_output))
+    index = load_inventory(args.inventory) if args.inventory else None
+    submitted = SubmissionIndex.load(args.since_submissions) if args.since_submissions else None
+    validator = BatchValidator() if args.validate else None
     if hasattr(args, 'biosample') and hasattr(args, 'species') and hasattr(args, 'tolid'):
-        if args.genome:
-            file_metadata = get_genome_metadata(args.species, args.tolid, args.biosample)
-            filename = f'submission_metadata/sequence_metadata/%s_%s_SRA_sequence_metadata.tsv' % (args.species, args.tolid)
-            write_file_metadata(file_metadata, filename)
-        if args.transcriptome:
-            file_metadata = get_transcriptome_metadata(args.species, args.tolid, args.biosample)
-            filename = f'submission_metadata/transcriptome_metadata/%s_%s_SRA_transcriptome_metadata.tsv' % (args.species, args.tolid)
-            write_file_metadata(file_metadata, filename)
-    elif args.filename:
-        process_metadata(args.filename, genomic = args.genome, transcriptomic = args.transcriptome)
\ No newline at end of file
+        with profiler.tolid_context(args.tolid):
+            process_single(args.species, args.tolid, args.biosample, genomic = args.genome, transcriptomic = args.transcriptome,
+                           recursive = args.recursive, index = index, submitted = submitted, validator = validator)
+    elif hasattr(args, 'port'):
+        serve(host = args.host, port = args.port, recursive = args.recursive, index = index, submitted = submitted, root = args.root)
+    elif hasattr(args, 'inputs'):
+        merge_metadata(args.inputs, output_dir = args.output_dir, max_rows = args.max_rows)
+    elif hasattr(args, 'filename'):
+        journal_filename = args.journal or (os.path.join(args.output_dir, 'batch_journal%s.jsonl' % (shard_suffix(args.shard))) if args.resume else None)
+        journal = Journal(journal_filename, resume = args.resume) if journal_filename else None
+        process_metadata(args.filename, genomic = args.genome, transcriptomic = args.transcriptome, recursive = args.recursive, jobs = args.jobs, index = index,
+                         consolidate = args.consolidate, max_rows = args.max_rows, output_dir = args.output_dir, journal = journal, shard = args.shard, submitted = submitted,
+                         validator = validator)
+    if get_checksum_resolver() is not None:
+        get_checksum_resolver().close()
+    if profiler.enabled:
+        profiler.print_summary()
+        if args.profile_output:
+            profiler.write(args.profile_output)
+    if validator is not None and validator.validate():
+        sys.exit(1)
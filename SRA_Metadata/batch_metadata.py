@@ -0,0 +1,191 @@
+from generate_SRA_metadata import (MetadataWriter, get_genome_metadata, get_species_listing, get_transcriptome_metadata,
+                                   iter_genome_metadata, iter_transcriptome_metadata, output_fieldnames, row_fieldnames, write_file_metadata)
+from journal import Journal
+from profiling import profiler
+from sequence_files import collect_orphans
+import csv
+import hashlib
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# The CLI and the service both accept batch options from users, so both check them here.
+max_jobs = 256
+
+def check_shard(shard, shards):
+    if not 1 <= shard <= shards:
+        raise ValueError('shard i/N needs 1 <= i <= N')
+    return shard, shards
+
+def check_batch_options(jobs = 1, max_rows = None, consolidate = False):
+    if not 1 <= jobs <= max_jobs:
+        raise ValueError('jobs must be between 1 and %i' % (max_jobs))
+    if max_rows is not None and max_rows < 1:
+        raise ValueError('max rows must be at least 1')
+    if max_rows and not consolidate:
+        raise ValueError('max rows only apply to consolidated output; add consolidate')
+
+def in_shard(tolid, shard):
+    if shard is None:
+        return True
+    number, shards = shard
+    return int(hashlib.md5(tolid.encode()).hexdigest(), 16) % shards == number - 1
+
+def shard_suffix(shard):
+    if shard is None:
+        return ''
+    return '_shard%iof%i' % (shard)
+
+def read_species_csv(filename):
+    species_dict = dict()
+    with open(filename, 'r', encoding='utf-8-sig') as file:
+        csv_reader = csv.DictReader(file)
+        for row in csv_reader:
+            if row['BioSample']:
+                species_dict[row['ToLID']] = {'BioSample':row['BioSample'], 'Species':row['Species']}
+    return species_dict
+
+def get_output_filename(metadata_pass, species, tolid, output_dir = 'submission_metadata'):
+    if metadata_pass == 'genomic':
+        return os.path.join(output_dir, 'sequence_metadata/%s_%s_SRA_sequence_metadata.tsv' % (species.replace(' ', '_'), tolid))
+    return os.path.join(output_dir, 'transcriptome_metadata/%s_%s_SRA_transcriptome_metadata.tsv' % (species.replace(' ', '_'), tolid))
+
+def list_species(species, tolid, recursive, index):
+    with profiler.tolid_context(tolid):
+        return get_species_listing(species, tolid, recursive = recursive, index = index)
+
+def run_metadata_pass(metadata_pass, species, tolid, biosample_accession, listing, journal = None, output = None, submitted = None):
+    listing = listing.result()
+    with profiler.tolid_context(tolid), collect_orphans() as orphans:
+        if metadata_pass == 'genomic':
+            with profiler.stage('genome_metadata'):
+                rows = list(iter_genome_metadata(species, tolid, biosample_accession, listing = listing, submitted = submitted))
+        else:
+            with profiler.stage('transcriptome_metadata'):
+                rows = list(iter_transcriptome_metadata(species, tolid, biosample_accession, listing = listing, submitted = submitted))
+    if journal is not None:
+        journal.record(Journal.key(tolid, metadata_pass, species, biosample_accession, output_fieldnames()), rows, orphans, output = output)
+    return rows, orphans
+
+def journaled_result(journal, key):
+    result = Future()
+    result.set_result(journal.result(key))
+    return result
+
+def submit_metadata_passes(executor, species_dict, passes, recursive, index, journal = None, output = None, submitted = None):
+    # Listings are queued ahead of the passes that wait on them, so a worker never blocks on unstarted work.
+    for tolid in species_dict.keys():
+        species = species_dict[tolid]['Species']
+        biosample_accession = species_dict[tolid]['BioSample']
+        keys = {metadata_pass: Journal.key(tolid, metadata_pass, species, biosample_accession, output_fieldnames()) for metadata_pass in passes}
+        if journal is not None and all(keys[metadata_pass] in journal for metadata_pass in passes):
+            listing = None
+        else:
+            listing = executor.submit(list_species, species, tolid, recursive, index)
+        for metadata_pass in passes:
+            if journal is not None and keys[metadata_pass] in journal:
+                yield tolid, metadata_pass, journaled_result(journal, keys[metadata_pass])
+            else:
+                yield tolid, metadata_pass, executor.submit(run_metadata_pass, metadata_pass, species, tolid, biosample_accession, listing,
+                                                            journal = journal, output = output(metadata_pass, species, tolid), submitted = submitted)
+
+def process_metadata(filename, genomic, transcriptomic, recursive = False, jobs = 1, index = None, consolidate = False, max_rows = None, output_dir = 'submission_metadata',
+                     journal = None, shard = None, submitted = None, validator = None):
+    species_dict = {tolid: row for tolid, row in read_species_csv(filename).items() if in_shard(tolid, shard)}
+    passes = [metadata_pass for metadata_pass, enabled in (('genomic', genomic), ('transcriptomic', transcriptomic)) if enabled]
+    writers = dict()
+    if consolidate:
+        writers['genomic'] = MetadataWriter(os.path.join(output_dir, 'SRA_sequence_metadata%s.tsv' % (shard_suffix(shard))), max_rows = max_rows)
+        writers['transcriptomic'] = MetadataWriter(os.path.join(output_dir, 'SRA_transcriptome_metadata%s.tsv' % (shard_suffix(shard))), max_rows = max_rows)
+    def output(metadata_pass, species, tolid):
+        if consolidate:
+            return writers[metadata_pass].filename
+        return get_output_filename(metadata_pass, species, tolid, output_dir)
+    def write_rows(tolid, metadata_pass, rows):
+        with profiler.tolid_context(tolid):
+            if consolidate:
+                writers[metadata_pass].write(row for _, row in rows)
+            else:
+                write_file_metadata(dict(rows), output(metadata_pass, species_dict[tolid]['Species'], tolid))
+    # With a validator, rows are only indexed as they arrive and every pass is written once the whole batch has passed.
+    validated = []
+    def write_result(tolid, metadata_pass, task):
+        if metadata_pass == passes[0]:
+            print(species_dict[tolid])
+        rows, orphans = task.result()
+        if validator is not None:
+            validator.add_rows(tolid, (row for _, row in rows), orphans)
+            if rows:
+                validated.append((tolid, metadata_pass, rows))
+        elif rows:
+            write_rows(tolid, metadata_pass, rows)
+    # Only a bounded window of passes is in flight, and results are written in CSV order as soon as they are next in line.
+    window = 2 * max(1, jobs) * max(1, len(passes))
+    pending = deque()
+    try:
+        with ThreadPoolExecutor(max_workers = max(1, jobs)) as executor:
+            for task in submit_metadata_passes(executor, species_dict, passes, recursive, index, journal = journal, output = output, submitted = submitted):
+                pending.append(task)
+                if len(pending) >= window:
+                    write_result(*pending.popleft())
+            while pending:
+                write_result(*pending.popleft())
+        if validator is not None and validator.report():
+            for result in validated:
+                write_rows(*result)
+    finally:
+        # A failed pass must still flush what was written and release the journal, so --resume can pick up from it.
+        for writer in writers.values():
+            writer.close()
+        if journal is not None:
+            journal.close()
+
+def find_metadata_files(inputs):
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for file in sorted(files):
+                    if file.endswith('.tsv'):
+                        yield os.path.join(root, file)
+        else:
+            yield path
+
+def merge_metadata(inputs, output_dir = 'submission_metadata', max_rows = None):
+    merged = {'sequence': dict(), 'transcriptome': dict()}
+    for path in find_metadata_files(inputs):
+        sheet = 'transcriptome' if 'transcriptome' in os.path.basename(path) else 'sequence'
+        with open(path, 'r', newline = '') as file:
+            for row in csv.DictReader(file, delimiter = '\t'):
+                key = (row['filename'], row['filename2'])
+                if key not in merged[sheet]:
+                    merged[sheet][key] = row
+                elif merged[sheet][key] != row:
+                    print('Conflicting rows for %s in %s; keeping the first one' % (row['filename'], path))
+    for sheet, rows in merged.items():
+        # Sheets written with and without --checksums can be merged; rows missing those columns leave them empty.
+        fieldnames = row_fieldnames(set().union(*rows.values()))
+        with MetadataWriter(os.path.join(output_dir, 'SRA_%s_metadata.tsv' % (sheet)), max_rows = max_rows, fieldnames = fieldnames) as writer:
+            writer.write(rows[key] for key in sorted(rows))
+
+def process_single(species, tolid, biosample_accession, genomic, transcriptomic, recursive = False, index = None, submitted = None, output_dir = 'submission_metadata',
+                   validator = None):
+    results = []
+    listing = get_species_listing(species, tolid, recursive = recursive, index = index)
+    with collect_orphans() as orphans:
+        if genomic:
+            file_metadata = get_genome_metadata(species, tolid, biosample_accession, listing = listing, submitted = submitted)
+            results.append((file_metadata, os.path.join(output_dir, 'sequence_metadata/%s_%s_SRA_sequence_metadata.tsv' % (species, tolid))))
+        if transcriptomic:
+            file_metadata = get_transcriptome_metadata(species, tolid, biosample_accession, listing = listing, submitted = submitted)
+            results.append((file_metadata, os.path.join(output_dir, 'transcriptome_metadata/%s_%s_SRA_transcriptome_metadata.tsv' % (species, tolid))))
+    if validator is not None:
+        validator.add_rows(tolid, (row for file_metadata, _ in results for row in file_metadata.values()), orphans)
+        if not validator.report():
+            return []
+    filenames = []
+    for file_metadata, filename in results:
+        write_file_metadata(file_metadata, filename)
+        if file_metadata:
+            filenames.append(filename)
+    return filenames
@@ -0,0 +1,208 @@
+import argparse
+import bisect
+import contextlib
+import csv
+import hashlib
+import json
+import os
+import platform
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import batch_metadata
+import generate_SRA_metadata
+from s3_listing import set_listing_cache, set_s3_client
+
+def parse_args():
+    parser = argparse.ArgumentParser(description = 'Time metadata generation against a synthetic GenomeArk tree served by an in-process S3 stub')
+    parser.add_argument(
+        '--species', type = int, default = 50, help = 'Number of synthetic ToLIDs (default: 50)'
+    )
+    parser.add_argument(
+        '--hic-pairs', type = int, default = 20, help = 'Arima Hi-C read pairs per ToLID (default: 20)'
+    )
+    parser.add_argument(
+        '--illumina-pairs', type = int, default = 40, help = 'Lane-split Illumina WGS read pairs per ToLID (default: 40)'
+    )
+    parser.add_argument(
+        '--hifi-movies', type = int, default = 4, help = 'PacBio HiFi movies per ToLID (default: 4)'
+    )
+    parser.add_argument(
+        '--barcodes', type = int, default = 8, help = 'Demultiplexed barcodes per HiFi movie (default: 8)'
+    )
+    parser.add_argument(
+        '--tissues', type = int, default = 3, help = 'Transcriptome tissues per ToLID (default: 3)'
+    )
+    parser.add_argument(
+        '--latency', type = float, default = 0.0, help = 'Seconds of latency injected into every S3 request (default: 0)'
+    )
+    parser.add_argument(
+        '--page-size', type = int, default = 1000, help = 'Keys per ListObjectsV2 page (default: 1000)'
+    )
+    parser.add_argument(
+        '--jobs', type = int, nargs = '+', default = [1, 8], help = 'Worker counts to benchmark process_metadata with (default: 1 8)'
+    )
+    parser.add_argument(
+        '-o', '--output', help = 'Write results as JSON to this file instead of stdout'
+    )
+    return parser.parse_args()
+
+class StubS3Client:
+    def __init__(self, objects, latency = 0.0, page_size = 1000):
+        self.objects = {object['Key']: object for object in objects}
+        self.keys = sorted(self.objects)
+        self.latency = latency
+        self.page_size = page_size
+        self.requests = Counter()
+        self.key_bytes = 0
+        self.object_bytes = 0
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.requests = Counter()
+            self.key_bytes = 0
+            self.object_bytes = 0
+
+    def _record(self, operation, key_bytes = 0, object_bytes = 0):
+        with self._lock:
+            self.requests[operation] += 1
+            self.key_bytes += key_bytes
+            self.object_bytes += object_bytes
+        if self.latency:
+            time.sleep(self.latency)
+
+    def list_objects_v2(self, Bucket, Prefix = '', Delimiter = None, ContinuationToken = None, MaxKeys = None):
+        page_size = min(MaxKeys or self.page_size, self.page_size)
+        if ContinuationToken:
+            position = bisect.bisect_right(self.keys, ContinuationToken)
+            if Delimiter and ContinuationToken.endswith(Delimiter):
+                position = bisect.bisect_left(self.keys, ContinuationToken + '￿')
+        else:
+            position = bisect.bisect_left(self.keys, Prefix)
+        contents = []
+        prefixes = []
+        last = None
+        while position < len(self.keys) and self.keys[position].startswith(Prefix) and len(contents) + len(prefixes) < page_size:
+            key = self.keys[position]
+            remainder = key[len(Prefix):]
+            if Delimiter and Delimiter in remainder:
+                last = Prefix + remainder.split(Delimiter, 1)[0] + Delimiter
+                prefixes.append({'Prefix': last})
+                position = bisect.bisect_left(self.keys, last + '￿')
+            else:
+                last = key
+                object = self.objects[key]
+                contents.append({'Key': key, 'Size': object['Size'], 'ETag': '"%s"' % (object['ETag']), 'LastModified': object['LastModified']})
+                position += 1
+        truncated = position < len(self.keys) and self.keys[position].startswith(Prefix)
+        response = {'IsTruncated': truncated, 'KeyCount': len(contents) + len(prefixes)}
+        if contents:
+            response['Contents'] = contents
+        if prefixes:
+            response['CommonPrefixes'] = prefixes
+        if truncated:
+            response['NextContinuationToken'] = last
+        # key_bytes approximates the response payload; object_bytes is the data size, as counted by --profile.
+        self._record('ListObjectsV2', key_bytes = sum(len(item.get('Key', item.get('Prefix'))) for item in contents + prefixes),
+                     object_bytes = sum(item['Size'] for item in contents))
+        return response
+
+def synthetic_object(key, size = 1000000000):
+    return {'Key': key, 'Size': size, 'ETag': hashlib.md5(key.encode()).hexdigest(), 'LastModified': '2024-01-01T00:00:00+00:00'}
+
+def build_synthetic_tree(args):
+    objects = []
+    rows = []
+    for number in range(args.species):
+        species = 'Synthetic_species%i' % (number)
+        tolid = 'sSynSpe%i' % (number)
+        rows.append({'ToLID': tolid, 'BioSample': 'SAMN%08i' % (number), 'Species': species.replace('_', ' ')})
+        genomic = 'species/%s/%s/genomic_data/' % (species, tolid)
+        for pair in range(args.hic_pairs):
+            for read in (1, 2):
+                objects.append(synthetic_object('%sarima/%s_HiC_S%i_L001_R%i_001.fastq.gz' % (genomic, tolid, pair + 1, read)))
+        for pair in range(args.illumina_pairs):
+            for read in (1, 2):
+                objects.append(synthetic_object('%sillumina/%s_S1_L%03i_R%i_001.fastq.gz' % (genomic, tolid, pair + 1, read)))
+        for movie in range(args.hifi_movies):
+            tag = 'm84091_2401%02i_000000_s%i' % (movie % 28 + 1, movie % 4 + 1)
+            for barcode in range(args.barcodes):
+                objects.append(synthetic_object('%spacbio_hifi/%s.hifi_reads.bc%04i.bam' % (genomic, tag, 2001 + barcode)))
+        transcriptomic = 'species/%s/%s/transcriptomic_data/' % (species, tolid)
+        for tissue in range(args.tissues):
+            for read in (1, 2):
+                objects.append(synthetic_object('%stissue%i/illumina/%s_RNA_R%i.fastq.gz' % (transcriptomic, tissue, tolid, read)))
+            objects.append(synthetic_object('%stissue%i/pacbio_hifi/m84091_240101_000000_s%i_flnc.bam' % (transcriptomic, tissue, tissue % 4 + 1)))
+    return objects, rows
+
+def timed(stub, name, function):
+    stub.reset()
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        rows = function()
+    seconds = time.perf_counter() - start
+    return {'name': name,
+            'seconds': round(seconds, 6),
+            'requests': dict(stub.requests),
+            'key_bytes': stub.key_bytes,
+            'object_bytes': stub.object_bytes,
+            'rows': rows}
+
+def per_tolid(rows, metadata_function, recursive):
+    def run():
+        count = 0
+        for row in rows:
+            listing = generate_SRA_metadata.get_species_listing(row['Species'], row['ToLID'], recursive = recursive)
+            count += len(metadata_function(row['Species'], row['ToLID'], row['BioSample'], listing = listing))
+        return count
+    return run
+
+def batch(rows, workdir, recursive, jobs):
+    def run():
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            batch_metadata.process_metadata('benchmark.csv', genomic = True, transcriptomic = True, recursive = recursive, jobs = jobs)
+        finally:
+            os.chdir(cwd)
+        count = 0
+        for root, _, files in os.walk(os.path.join(workdir, 'submission_metadata')):
+            for file in files:
+                with open(os.path.join(root, file)) as tsv:
+                    count += sum(1 for _ in tsv) - 1
+        return count
+    return run
+
+def run_benchmarks(args):
+    objects, rows = build_synthetic_tree(args)
+    stub = StubS3Client(objects, latency = args.latency, page_size = args.page_size)
+    set_s3_client(stub)
+    set_listing_cache(None)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, 'benchmark.csv'), 'w', newline = '') as file:
+            writer = csv.DictWriter(file, fieldnames = ['ToLID', 'BioSample', 'Species'])
+            writer.writeheader()
+            writer.writerows(rows)
+        for recursive in (False, True):
+            mode = 'recursive' if recursive else 'per_directory'
+            results.append(timed(stub, 'get_genome_metadata/%s' % (mode), per_tolid(rows, generate_SRA_metadata.get_genome_metadata, recursive)))
+            results.append(timed(stub, 'get_transcriptome_metadata/%s' % (mode), per_tolid(rows, generate_SRA_metadata.get_transcriptome_metadata, recursive)))
+            for jobs in args.jobs:
+                results.append(timed(stub, 'process_metadata/%s/jobs_%i' % (mode, jobs), batch(rows, workdir, recursive, jobs)))
+    return {'python': platform.python_version(),
+            'config': {key: value for key, value in vars(args).items() if key != 'output'},
+            'objects': len(objects),
+            'results': results}
+
+if __name__ == '__main__':
+    args = parse_args()
+    report = json.dumps(run_benchmarks(args), indent = 2)
+    if args.output:
+        with open(args.output, 'w') as out:
+            out.write(report + '\n')
+    else:
+        print(report)
@@ -0,0 +1,99 @@
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from profiling import profiled, profiler
+from s3_listing import get_s3_client
+
+checksum_fieldnames = ['filesize', 'md5', 'filesize2', 'md5_2']
+
+_resolver = None
+
+def set_checksum_resolver(resolver):
+    global _resolver
+    _resolver = resolver
+
+def get_checksum_resolver():
+    return _resolver
+
+def is_multipart(etag):
+    # Multipart uploads get an ETag of the form <md5 of part md5s>-<part count>, which is not the file's MD5.
+    return '-' in etag
+
+class ChecksumResolver:
+    def __init__(self, part_size = 8 * 1024 * 1024, read_ahead = 4, jobs = 4, cache = None, bucket = 'genomeark'):
+        self.part_size = part_size
+        self.read_ahead = read_ahead
+        self.jobs = jobs
+        self.cache = cache
+        self.bucket = bucket
+        # Concurrent batch passes each call checksum_all, so the resolver itself admits at most jobs files to hashing.
+        # That holds at most jobs * read_ahead parts in memory, whatever the number of passes.
+        self._hashing = threading.BoundedSemaphore(max(1, jobs))
+        # Ranges are fetched on their own pool so file workers never wait on their own queue.
+        self._ranges = ThreadPoolExecutor(max_workers = max(1, jobs * read_ahead))
+
+    def _read_range(self, key, start, end):
+        response = get_s3_client().get_object(Bucket = self.bucket, Key = key, Range = 'bytes=%i-%i' % (start, end))
+        data = response['Body'].read()
+        profiler.count('checksum_requests')
+        profiler.count('checksum_bytes', len(data))
+        return data
+
+    @profiled('checksum')
+    def _hash(self, object):
+        md5 = hashlib.md5()
+        ranges = ((start, min(start + self.part_size, object['Size']) - 1) for start in range(0, object['Size'], self.part_size))
+        pending = deque()
+        with self._hashing:
+            for start, end in ranges:
+                pending.append(self._ranges.submit(self._read_range, object['Key'], start, end))
+                if len(pending) >= self.read_ahead:
+                    md5.update(pending.popleft().result())
+            while pending:
+                md5.update(pending.popleft().result())
+        return md5.hexdigest()
+
+    def checksum(self, object):
+        etag = object.get('ETag') or ''
+        if not etag:
+            # Plain key-list inventories carry neither size nor ETag, so those objects cost one HEAD request.
+            response = get_s3_client().head_object(Bucket = self.bucket, Key = object['Key'])
+            profiler.count('checksum_requests')
+            etag = response['ETag'].strip('"')
+            object = dict(object, Size = response['ContentLength'], ETag = etag)
+        if etag and not is_multipart(etag):
+            return {'size': object['Size'], 'md5': etag}
+        if self.cache is not None and etag:
+            cached = self.cache.get(etag)
+            if cached is not None:
+                return {'size': object['Size'], 'md5': cached}
+        md5 = self._hash(object)
+        if self.cache is not None and etag:
+            self.cache.put(etag, md5)
+        return {'size': object['Size'], 'md5': md5}
+
+    def checksum_all(self, objects):
+        objects = list(objects)
+        if not objects:
+            return {}
+        with ThreadPoolExecutor(max_workers = max(1, min(self.jobs, len(objects)))) as executor:
+            checksums = executor.map(self.checksum, objects)
+            return {object['Key']: checksum for object, checksum in zip(objects, checksums)}
+
+    def close(self):
+        self._ranges.shutdown()
+
+def file_checksums(objects):
+    if _resolver is None:
+        return {}
+    return _resolver.checksum_all(objects)
+
+def checksum_columns(checksums, filename, filename2 = None):
+    if _resolver is None:
+        return {}
+    columns = {'filesize': checksums[filename]['size'], 'md5': checksums[filename]['md5']}
+    if filename2:
+        columns.update({'filesize2': checksums[filename2]['size'], 'md5_2': checksums[filename2]['md5']})
+    return columns
@@ -1,22 +1,26 @@
-import boto3
 import os
 import csv
 import re
+from checksums import checksum_columns, checksum_fieldnames, file_checksums, get_checksum_resolver
+from header_probe import probe_instruments
+from metadata_rows import MetadataRow, metadata_fieldnames, row_template
+from platform_rules import compile_rules, default_rules_path, read_rules
+from profiling import profiled
+from s3_listing import S3Listing, list_tree
+from sequence_files import classify_pacbio_file, pair_reads, report_orphans
 
 def get_s3_dirs(prefix, bucket = "genomeark"):
-    s3 = boto3.client("s3")
-    objects = s3.list_objects(Bucket = bucket, Prefix = prefix, Delimiter = "/")
-    if "CommonPrefixes" in objects.keys():
-        dirs = [object['Prefix'] for object in objects["CommonPrefixes"]]
-    else:
-        dirs = []
-    return dirs
+    return S3Listing(bucket = bucket).dirs(prefix)
 
 def get_s3_files(prefix, bucket = "genomeark"):
-    s3 = boto3.client("s3")
-    objects = s3.list_objects(Bucket = bucket, Prefix = prefix, Delimiter = '/')['Contents']
-    filepaths = [object['Key'] for object in objects]
-    return filepaths
+    return S3Listing(bucket = bucket).files(prefix)
+
+def get_species_listing(species, tolid, recursive = False, index = None, bucket = "genomeark"):
+    if index is not None:
+        return index
+    if recursive:
+        return list_tree('species/%s/%s/' % (species.replace(' ', '_'), tolid), bucket = bucket)
+    return S3Listing(bucket = bucket)
 
 metadata_dict = {
     '5mC': {
@@ -200,8 +204,6 @@ metadata_dict = {
     },    
 }
 
-s3 = boto3.client('s3')
-
 filetypes = ['bam', 'fastq.gz', 'fq.gz', 'fasta.gz', 'fa.gz']
 pacbio_instruments = {'m54306Ue':'Sequel II',
                    'm64330e':'Sequel II',
@@ -211,215 +213,212 @@ pacbio_instruments = {'m54306Ue':'Sequel II',
 
 re_extensions = [re.compile('.*.fastq.gz$'), re.compile('.*.bam$')]
 
-re_patterns = {'fastq': re.compile('.*hifi_reads\\..*fastq.gz$'),
-               'demultiplex_bam': re.compile('.*bc[0-9]{4}--bc[0-9]{4}\\.bam$'),
-               'subreads': re.compile('.*subreads\\.bam$'),
-               'reads': re.compile('.*\\.reads\\.bam$'),
-               '5mC': re.compile('.*with_5mC\\.bam$'),
-               'hifi_bam': re.compile('.*hifi_reads\\.(bc[0-9]{4}\\.)?bam$')}
-
-def get_HiC_filepath_pairs(filepaths):
-    filepaths
-    pairs = []
-    while filepaths:
-        filename = filepaths[0]
-        extension = filename.split('.', 1)[-1]
-        if extension == 'fastq.gz':
-            forward_read = filename
-            reverse_read = forward_read.replace('R1', 'R2')
-            if reverse_read == forward_read:
-                reverse_read = forward_read.replace('_1', '_2')
-            pairs.append((forward_read, reverse_read))
-            filepaths.pop(0)
-            filepaths.pop(filepaths.index(reverse_read))
-        else:
-            filepaths.pop(0)
-    return pairs
-
-def get_genome_metadata(species, tolid, biosample_accession):
-    file_metadata = dict()
+class MetadataPass:
+    def __init__(self, species, tolid, biosample_accession, submitted = None):
+        self.species = species
+        self.tolid = tolid
+        self.biosample_accession = biosample_accession
+        self.submitted = submitted
+        self.counters = dict()
+
+    def is_submitted(self, filepath):
+        return bool(self.submitted) and self.submitted.is_submitted(filepath, self.tolid)
+
+    def next_number(self, counter):
+        # Libraries named in one counter share a numbering, continued from earlier submissions in delta mode.
+        if counter not in self.counters:
+            self.counters[counter] = self.submitted.next_library_number(self.tolid, counter) if self.submitted else 1
+        number = self.counters[counter]
+        self.counters[counter] += 1
+        return number
+
+    def row(self, rule, metadata, template, instrument, filename, filename2 = '', checksums = None, **fields):
+        fields.update(species = self.species, tolid = self.tolid, library = metadata['library'], title = metadata['title'])
+        return MetadataRow(template, self.biosample_accession, rule.library_id.format(**fields), rule.title.format(**fields), instrument,
+                           filename, filename2, checksum_columns(checksums, filename, filename2))
+
+def build_read_pairs(rule, metadata_pass, location, objects, fields):
+    filepath_pairs, orphans = pair_reads(list(objects))
+    report_orphans([orphan[len(location):] for orphan in orphans], location)
+    filepath_pairs = [pair for pair in filepath_pairs if not metadata_pass.is_submitted(pair[0])]
+    metadata = rule.metadata(location.split('/')[-2])
+    instruments = probe_instruments((objects[pair[0]] for pair in filepath_pairs), metadata['platform'])
+    checksums = file_checksums(objects[filepath] for pair in filepath_pairs for filepath in pair)
+    template = row_template(metadata, rule.filetype, rule.assembly)
+    for pair in filepath_pairs:
+        number = metadata_pass.next_number(rule.counter) if rule.counter else None
+        yield pair[0], metadata_pass.row(rule, metadata, template, instruments.get(pair[0], metadata['instrument_model']),
+                                         pair[0], pair[1], checksums, number = number, **fields)
+
+def build_pacbio_movies(rule, metadata_pass, location, objects, fields):
+    library_numbers = metadata_pass.submitted.library_numbers_for(metadata_pass.tolid) if metadata_pass.submitted else dict()
+    next_library_number = max(library_numbers.values(), default = 0) + 1
+    classified = [(filepath, classify_pacbio_file(filepath.split('/')[-1], pacbio_instruments)) for filepath in objects]
+    classified = [(filepath, classification) for filepath, classification in classified
+                  if classification and not metadata_pass.is_submitted(filepath)]
+    # Every file from a movie shares its instrument, so only the first BAM of each movie is probed.
+    movie_files = dict()
+    for filepath, classification in classified:
+        if filepath.endswith('.bam'):
+            movie_files.setdefault(classification.metadata_tag, objects[filepath])
+    instruments = probe_instruments(movie_files.values(), 'PACBIO_SMRT')
+    checksums = file_checksums(objects[filepath] for filepath, _ in classified)
+    movie_instruments = {tag: instruments[object['Key']] for tag, object in movie_files.items() if object['Key'] in instruments}
+    for filepath, classification in classified:
+        instrument = movie_instruments.get(classification.metadata_tag, classification.instrument)
+        metadata = rule.templates[classification.filetype]
+        if classification.metadata_tag not in library_numbers:
+            library_numbers[classification.metadata_tag] = next_library_number
+            next_library_number += 1
+        template = row_template(metadata, 'fastq' if classification.filetype == 'fastq' else 'bam', metadata['assembly'],
+                                rule.design_description(instrument, metadata))
+        yield filepath, metadata_pass.row(rule, metadata, template, instrument, filepath, checksums = checksums,
+                                          number = library_numbers[classification.metadata_tag], **fields)
+
+def build_files(rule, metadata_pass, location, objects, fields):
+    filepaths = [filepath for filepath in objects
+                 if filepath.split('/')[-1].split(os.extsep, 1)[-1] in rule.extensions and not metadata_pass.is_submitted(filepath)]
+    metadata = rule.metadata(location.split('/')[-2])
+    instruments = probe_instruments((objects[filepath] for filepath in filepaths), metadata['platform'])
+    checksums = file_checksums(objects[filepath] for filepath in filepaths)
+    template = row_template(metadata, rule.filetype, rule.assembly)
+    for filepath in filepaths:
+        number = metadata_pass.next_number(rule.counter) if rule.counter else None
+        yield filepath, metadata_pass.row(rule, metadata, template, instruments.get(filepath, metadata['instrument_model']),
+                                          filepath, checksums = checksums, number = number, **fields)
+
+row_builders = {'read_pairs': build_read_pairs,
+                'pacbio_movies': build_pacbio_movies,
+                'files': build_files}
+
+_platform_rules = None
+
+def load_platform_rules(path = default_rules_path):
+    return compile_rules(read_rules(path), metadata_dict, row_builders)
+
+def set_platform_rules(rules):
+    global _platform_rules
+    _platform_rules = rules
+
+def get_platform_rules():
+    global _platform_rules
+    if _platform_rules is None:
+        _platform_rules = load_platform_rules()
+    return _platform_rules
+
+def list_platform_objects(listing, rules, section, location):
+    return {object['Key']: object for object in listing.objects(location) if rules.included(section, object['Key'].split('/')[-1])}
+
+def iter_genome_metadata(species, tolid, biosample_accession, listing = None, submitted = None):
+    if listing is None:
+        listing = S3Listing()
     prefix = f'species/%s/%s/genomic_data/' % (species.replace(' ', '_'), tolid)
-    dirs = get_s3_dirs(prefix)
+    dirs = listing.dirs(prefix)
     species = species.replace('_', ' ')
     if not dirs:
         print(f'Genome sequence data for %s, %s not found in GenomeArk.' % (species, tolid))
-    else:
-        hic_pairs_count = 1
-        for subdir in dirs:
-            platform = subdir.split('/')[-2]
-            filepaths = get_s3_files(prefix = subdir)
-            filepaths = [filepath.split('/')[-1] for filepath in filepaths if '.bam' in filepath.split('/')[-1] or '.fastq.gz' in filepath.split('/')[-1]]
-            if platform in ['arima', 'dovetail', '10X', '10x']:
-                filepath_pairs = get_HiC_filepath_pairs(filepaths)
-                for pair in filepath_pairs:
-                    metadata = metadata_dict[platform.lower()]
-                    file_metadata[pair[0]] = {'biosample_accession': biosample_accession, 
-                                        'library_ID': f'%s_%s_%i' % (tolid, metadata['library'], hic_pairs_count), 
-                                        'title': f'%s %s' % (species, metadata['title']), 
-                                        'library_strategy': metadata['library_strategy'], 
-                                        'library_source': metadata['library_source'], 
-                                        'library_selection': metadata['library_selection'],
-                                        'library_layout': metadata['library_layout'], 
-                                        'platform': metadata['platform'], 
-                                        'instrument_model': metadata['instrument_model'], 
-                                        'design_description': metadata['design_description'], 
-                                        'filetype': 'fastq',
-                                        'filename': f'%s%s' % (subdir, pair[0]), 
-                                        'filename2': f'%s%s' % (subdir, pair[1]),
-                                        'filename3':'',
-                                        'filename4':'',
-                                        'assembly':'',
-                                        'fasta_file':'',
-                                        }
-                    hic_pairs_count += 1
-            if platform == "illumina":
-                filepath_pairs = get_HiC_filepath_pairs(filepaths)
-                for pair in filepath_pairs:
-                    metadata = metadata_dict[platform.lower()]
-                    file_metadata[pair[0]] = {'biosample_accession': biosample_accession, 
-                                        'library_ID': f'%s_%s_%i' % (tolid, metadata['library'], filepath_pairs.index(pair) + 1), 
-                                        'title': f'%s %s' % (species, metadata['title']), 
-                                        'library_strategy': metadata['library_strategy'], 
-                                        'library_source': metadata['library_source'], 
-                                        'library_selection': metadata['library_selection'],
-                                        'library_layout': metadata['library_layout'], 
-                                        'platform': metadata['platform'], 
-                                        'instrument_model': metadata['instrument_model'], 
-                                        'design_description': metadata['design_description'], 
-                                        'filetype': 'fastq',
-                                        'filename': f'%s%s' % (subdir, pair[0]), 
-                                        'filename2': f'%s%s' % (subdir, pair[1]),
-                                        'filename3':'',
-                                        'filename4':'',
-                                        'assembly':'',
-                                        'fasta_file':'',
-                                        }
-            elif platform == "pacbio_hifi":
-                filetype_counts = {
-                    'fastq': 1,
-                    'demultiplex_bam': 1,
-                    'subreads': 1,
-                    'reads':1,
-                    '5mC': 1,
-                    'hifi_bam': 1
-                }
-                metadata_tags = []
-                for filepath in filepaths:
-                    extension = filepath.split('.', 1)[1]
-                    metadata_tag = filepath.split('.', 1)[0]
-                    instrument_number = metadata_tag.split('_')[0]
-                    if instrument_number in pacbio_instruments.keys():
-                        instrument = pacbio_instruments[instrument_number]
-                    else:
-                        instrument = 'Sequel II'
-                    filetype = ''
-                    if '.fastq.gz' in extension and 'hifi_reads' in extension:
-                        filetype = 'fastq'
-                    elif '.bam' in extension:
-                        filetype = [type for type in re_patterns.keys() if re.match(re_patterns[type], filepath)]
-                        if filetype:
-                            filetype = filetype[0]
-                    if filetype:
-                        metadata = metadata_dict[filetype]
-                        if metadata_tag not in metadata_tags:
-                            metadata_tags.append(metadata_tag)
-                        file_metadata[filepath] = {'biosample_accession': biosample_accession, 
-                                        'library_ID': f'%s_%s_%i' % (tolid, metadata['library'], metadata_tags.index(metadata_tag) + 1), 
-                                        'title': f'%s %s' % (species, metadata['title']), 
-                                        'library_strategy': metadata['library_strategy'], 
-                                        'library_source': metadata['library_source'], 
-                                        'library_selection': metadata['library_selection'],
-                                        'library_layout': metadata['library_layout'], 
-                                        'platform': metadata['platform'], 
-                                        'instrument_model': instrument, 
-                                        'design_description': 'SAGE blue pippin' if instrument == 'Sequel II' else 'PippinHT size selection',
-                                        'filetype': 'fastq' if filetype == 'fastq' else 'bam',
-                                        'filename': f'%s%s' % (subdir, filepath),
-                                        'filename2':'',
-                                        'filename3':'',
-                                        'filename4':'',
-                                        'assembly':metadata['assembly'],
-                                        'fasta_file':'',
-                                        }
-                        filetype_counts[filetype] += 1
-    return file_metadata
-
-def get_transcriptome_metadata(species, tolid, biosample_accession):
-    file_metadata = dict()
+        return
+    rules = get_platform_rules()
+    metadata_pass = MetadataPass(species, tolid, biosample_accession, submitted = submitted)
+    for subdir in dirs:
+        rule = rules.lookup('genomic', subdir.split('/')[-2])
+        if rule is not None:
+            yield from rule.build(rule, metadata_pass, subdir, list_platform_objects(listing, rules, 'genomic', subdir), {})
+
+def iter_transcriptome_metadata(species, tolid, biosample_accession, listing = None, submitted = None):
+    if listing is None:
+        listing = S3Listing()
     prefix = f'species/%s/%s/transcriptomic_data/' % (species.replace(' ', '_'), tolid)
-    dirs = get_s3_dirs(prefix)
+    dirs = listing.dirs(prefix)
     species = species.replace('_', ' ')
     if not dirs:
         print(f'Transcriptome data for %s, %s not found in GenomeArk.' % (species, tolid))
-        return file_metadata
-    else:
-        for subdir in dirs:
-            tissue = subdir.split('/')[-2]
-            tissue_name = tissue.replace('_', ' ').capitalize()
-            platforms = [platform.split('/')[-2] for platform in get_s3_dirs(prefix = subdir)]
-            for platform in platforms:
-                filepaths = get_s3_files(prefix = f'%s%s/' % (subdir, platform))
-                if platform == 'illumina':
-                    filepath_pairs = get_HiC_filepath_pairs(filepaths)
-                    for pair in filepath_pairs:
-                        metadata = metadata_dict['RNA-Seq']
-                        file_metadata[pair[0]] = {'biosample_accession': biosample_accession, 
-                                            'library_ID': f'%s_%s_%s' % (tolid, metadata['library'], tissue), 
-                                            'title': f'%s %s %s' % (species, tissue_name, metadata['title']), 
-                                            'library_strategy': metadata['library_strategy'], 
-                                            'library_source': metadata['library_source'], 
-                                            'library_selection': metadata['library_selection'],
-                                            'library_layout': metadata['library_layout'], 
-                                            'platform': metadata['platform'], 
-                                            'instrument_model': metadata['instrument_model'], 
-                                            'design_description': metadata['design_description'], 
-                                            'filetype': 'fastq',
-                                            'filename': pair[0], 
-                                            'filename2': pair[1],
-                                            'filename3':'',
-                                            'filename4':'',
-                                            'assembly':'',
-                                            'fasta_file':'',
-                                            }
-                elif platform in ['pacbio_hifi', 'pacbio_kinnex']:
-                    for filepath in filepaths:
-                        file = filepath.split('/')[-1]
-                        extension = file.split(os.extsep, 1)[-1]
-                        if extension == 'bam':
-                            if platform == 'pacbio_hifi':
-                                metadata = metadata_dict['Iso-Seq']
-                            elif platform == 'pacbio_kinnex':
-                                metadata = metadata_dict['Kinnex']
-                            file_metadata[file] = {'biosample_accession': biosample_accession, 
-                                                'library_ID': f'%s_%s' % (tolid, metadata['library']), 
-                                                'title': f'%s %s %s' % (species, tissue.capitalize(), metadata['title']), 
-                                                'library_strategy': metadata['library_strategy'], 
-                                                'library_source': metadata['library_source'], 
-                                                'library_selection': metadata['library_selection'],
-                                                'library_layout': metadata['library_layout'], 
-                                                'platform': metadata['platform'], 
-                                                'instrument_model': metadata['instrument_model'], 
-                                                'design_description': metadata['design_description'], 
-                                                'filetype': 'bam',
-                                                'filename': filepath, 
-                                                'filename2': '',
-                                                'filename3':'',
-                                                'filename4':'',
-                                                'assembly':'unaligned',
-                                                'fasta_file':'',
-                                                }
-    return file_metadata
+        return
+    rules = get_platform_rules()
+    metadata_pass = MetadataPass(species, tolid, biosample_accession, submitted = submitted)
+    for subdir in dirs:
+        tissue = subdir.split('/')[-2]
+        fields = {'tissue': tissue, 'tissue_name': tissue.replace('_', ' ').capitalize(), 'tissue_label': tissue.capitalize()}
+        for platform_dir in listing.dirs(subdir):
+            rule = rules.lookup('transcriptomic', platform_dir.split('/')[-2])
+            if rule is not None:
+                yield from rule.build(rule, metadata_pass, platform_dir, list_platform_objects(listing, rules, 'transcriptomic', platform_dir), fields)
+
+@profiled('genome_metadata')
+def get_genome_metadata(species, tolid, biosample_accession, listing = None, submitted = None):
+    return dict(iter_genome_metadata(species, tolid, biosample_accession, listing = listing, submitted = submitted))
+
+@profiled('transcriptome_metadata')
+def get_transcriptome_metadata(species, tolid, biosample_accession, listing = None, submitted = None):
+    return dict(iter_transcriptome_metadata(species, tolid, biosample_accession, listing = listing, submitted = submitted))
 
+def row_fieldnames(row):
+    return metadata_fieldnames + [column for column in checksum_fieldnames if column in row]
+
+def output_fieldnames():
+    # Columns follow the run's options rather than the first row, which may come from a journal written by another run.
+    return metadata_fieldnames + (checksum_fieldnames if get_checksum_resolver() is not None else [])
+
+@profiled('write_file_metadata')
 def write_file_metadata(file_metadata, filename):
     if file_metadata:
         os.makedirs(os.path.dirname(filename), exist_ok=True)
         print(f'Metadata saved to %s' % (filename))
         with open(filename, mode = 'w') as out:
-            fieldnames = ['biosample_accession', 'library_ID', 'title', 'library_strategy', 'library_source', 'library_selection',
-                    'library_layout', 'platform', 'instrument_model', 'design_description', 'filetype', 'filename', 'filename2',
-                    'filename3', 'filename4', 'assembly', 'fasta_file']
-            writer = csv.DictWriter(out, delimiter ='\t', fieldnames = fieldnames)
+            writer = csv.DictWriter(out, delimiter ='\t', fieldnames = output_fieldnames())
             writer.writeheader()
             for key in file_metadata.keys():
                 line = file_metadata[key]
                 writer.writerow(line)
+
+class MetadataWriter:
+    def __init__(self, filename, max_rows = None, buffer_size = 1024 * 1024, fieldnames = None):
+        self.filename = filename
+        self.fieldnames = fieldnames
+        self.max_rows = max_rows
+        self.buffer_size = buffer_size
+        self.filenames = []
+        self.rows = 0
+        self._out = None
+        self._writer = None
+        self._shard_rows = 0
+
+    def _shard_filename(self):
+        if not self.max_rows:
+            return self.filename
+        stem, extension = os.path.splitext(self.filename)
+        return '%s_part%i%s' % (stem, len(self.filenames) + 1, extension)
+
+    def _open_shard(self):
+        self.close()
+        if self.fieldnames is None:
+            self.fieldnames = output_fieldnames()
+        filename = self._shard_filename()
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        self._out = open(filename, mode = 'w', buffering = self.buffer_size)
+        self._writer = csv.DictWriter(self._out, delimiter ='\t', fieldnames = self.fieldnames)
+        self._writer.writeheader()
+        self._shard_rows = 0
+        self.filenames.append(filename)
+
+    @profiled('write_file_metadata')
+    def write(self, rows):
+        for row in rows:
+            if self._writer is None or (self.max_rows and self._shard_rows >= self.max_rows):
+                self._open_shard()
+            self._writer.writerow(row)
+            self._shard_rows += 1
+            self.rows += 1
+
+    def close(self):
+        if self._out is not None:
+            self._out.close()
+            print('Metadata saved to %s' % (self.filenames[-1]))
+            self._out = None
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,163 @@
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from profiling import profiled, profiler
+from s3_listing import get_s3_client
+
+pacbio_models = {'RS': 'PacBio RS II',
+                 'SEQUEL': 'Sequel',
+                 'SEQUELII': 'Sequel II',
+                 'SEQUELIIE': 'Sequel IIe',
+                 'REVIO': 'Revio',
+                 'VEGA': 'Vega'}
+
+# Illumina instrument IDs start with a model-specific prefix; two-letter prefixes are checked first.
+illumina_models = {'LH': 'Illumina NovaSeq X',
+                   'VH': 'NextSeq 2000',
+                   'VL': 'NextSeq 1000',
+                   'NB': 'NextSeq 500',
+                   'NS': 'NextSeq 500',
+                   'FS': 'Illumina iSeq 100',
+                   'MN': 'Illumina MiniSeq',
+                   'A': 'Illumina NovaSeq 6000',
+                   'M': 'Illumina MiSeq',
+                   'K': 'Illumina HiSeq 4000',
+                   'J': 'Illumina HiSeq 3000',
+                   'E': 'HiSeq X Ten',
+                   'D': 'Illumina HiSeq 2500'}
+
+_probe = None
+
+def set_header_probe(probe):
+    global _probe
+    _probe = probe
+
+def get_header_probe():
+    return _probe
+
+def inflate(data):
+    # BAM (BGZF) and most FASTQ.gz files are concatenated gzip members; a member cut off by the range is decoded as far as it goes.
+    inflated = bytearray()
+    while data:
+        decompressor = zlib.decompressobj(31)
+        try:
+            inflated += decompressor.decompress(data)
+        except zlib.error:
+            break
+        if not decompressor.eof:
+            break
+        data = decompressor.unused_data
+    return bytes(inflated)
+
+def parse_bam_header(data):
+    if data[:4] != b'BAM\x01' or len(data) < 8:
+        return {}
+    text_length = int.from_bytes(data[4:8], 'little')
+    header = dict()
+    for line in data[8:8 + text_length].decode('utf-8', 'replace').splitlines():
+        fields = line.split('\t')
+        tags = dict(field.split(':', 1) for field in fields[1:] if ':' in field)
+        if fields[0] == '@RG' and 'instrument_model' not in header:
+            model = tags.get('PM', '').upper()
+            if model in pacbio_models:
+                header['instrument_model'] = pacbio_models[model]
+            if 'PL' in tags:
+                header['platform'] = tags['PL'].upper()
+    return header
+
+def parse_fastq_header(data):
+    line = data.split(b'\n', 1)[0].decode('utf-8', 'replace')
+    if not line.startswith('@'):
+        return {}
+    fields = line[1:].split(' ', 1)[0].split(':')
+    if len(fields) < 7:
+        return {}
+    instrument = fields[0]
+    header = dict()
+    for prefix in (instrument[:2], instrument[:1]):
+        if prefix in illumina_models:
+            header['instrument_model'] = illumina_models[prefix]
+            header['platform'] = 'ILLUMINA'
+            break
+    return header
+
+class HeaderProbe:
+    def __init__(self, bytes_per_file = 65536, budget = 1024 * 1024 * 1024, jobs = 8, cache = None, bucket = 'genomeark'):
+        self.bytes_per_file = bytes_per_file
+        self.limit = budget
+        self.budget = budget
+        self.exhausted = False
+        self.jobs = jobs
+        self.cache = cache
+        self.bucket = bucket
+        self._lock = threading.Lock()
+
+    def reset(self):
+        # A warm service keeps one probe, so each request starts with the full budget again.
+        with self._lock:
+            self.budget = self.limit
+            self.exhausted = False
+
+    def _reserve(self):
+        with self._lock:
+            if self.budget < self.bytes_per_file:
+                if not self.exhausted:
+                    self.exhausted = True
+                    print('Header probe budget of %.0f MB used up; remaining files keep their default instrument models' % (self.limit / 1024 / 1024))
+                return False
+            self.budget -= self.bytes_per_file
+            return True
+
+    @profiled('header_probe')
+    def probe(self, object):
+        etag = object.get('ETag')
+        if self.cache is not None and etag:
+            cached = self.cache.get(etag)
+            if cached is not None:
+                return cached
+        # An empty object has no header, and S3 rejects any range on it.
+        if object.get('Size') == 0 or not self._reserve():
+            return {}
+        try:
+            response = get_s3_client().get_object(Bucket = self.bucket, Key = object['Key'],
+                                                 Range = 'bytes=0-%i' % (self.bytes_per_file - 1))
+            data = response['Body'].read()
+        except (BotoCoreError, ClientError) as error:
+            # Probing is optional, so a file that cannot be read keeps the folder's default instrument.
+            print('Could not probe %s: %s' % (object['Key'], error))
+            profiler.count('probe_errors')
+            return {}
+        profiler.count('probe_requests')
+        profiler.count('probe_bytes', len(data))
+        if object['Key'].endswith('.bam'):
+            header = parse_bam_header(inflate(data))
+        elif object['Key'].endswith('.gz'):
+            header = parse_fastq_header(inflate(data))
+        else:
+            header = parse_fastq_header(data)
+        # An empty header may only mean the range was too short, so it is probed again next run.
+        if self.cache is not None and etag and header:
+            self.cache.put(etag, header)
+        return header
+
+    def probe_all(self, objects):
+        objects = list(objects)
+        if not objects:
+            return {}
+        with ThreadPoolExecutor(max_workers = max(1, min(self.jobs, len(objects)))) as executor:
+            headers = executor.map(self.probe, objects)
+            return {object['Key']: header for object, header in zip(objects, headers)}
+
+def same_platform(header, platform):
+    # BAM @RG PL says PACBIO where SRA says PACBIO_SMRT, so only the vendor part is compared.
+    return not header.get('platform') or not platform or header['platform'].split('_')[0] == platform.upper().split('_')[0]
+
+def probe_instruments(objects, platform = None):
+    if _probe is None:
+        return {}
+    # A header from another platform means the file is in the wrong folder, so its model is not trusted over the folder default.
+    return {key: header['instrument_model'] for key, header in _probe.probe_all(objects).items()
+            if header.get('instrument_model') and same_platform(header, platform)}
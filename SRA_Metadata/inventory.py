@@ -0,0 +1,106 @@
+import csv
+import gzip
+import io
+import json
+import os
+import re
+from urllib.parse import unquote_plus
+
+from s3_listing import PrefixIndex
+
+default_schema = ['Bucket', 'Key', 'Size', 'LastModifiedDate', 'ETag']
+re_ls_line = re.compile('^\\d{4}-\\d{2}-\\d{2} \\d{2}:\\d{2}:\\d{2}\\s+(\\d+)\\s+(.+)$')
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path), encoding = 'utf-8')
+    return open(path, 'r', encoding = 'utf-8')
+
+def read_inventory_csv(path, schema, bucket):
+    fields = [field.strip() for field in schema]
+    with open_text(path) as file:
+        for row in csv.reader(file):
+            record = dict(zip(fields, row))
+            if 'Bucket' in record and record['Bucket'] != bucket:
+                continue
+            yield {'Key': unquote_plus(record['Key']),
+                   'Size': int(record['Size']) if record.get('Size') else 0,
+                   'ETag': record.get('ETag', '').strip('"'),
+                   'LastModified': record.get('LastModifiedDate', '')}
+
+def read_inventory_parquet(path, bucket):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('Reading Parquet inventories requires pyarrow (pip install pyarrow)')
+    table = pq.read_table(path)
+    columns = {name.lower(): name for name in table.column_names}
+    for record in table.to_pylist():
+        if 'bucket' in columns and record[columns['bucket']] != bucket:
+            continue
+        yield {'Key': record[columns['key']],
+               'Size': record[columns['size']] or 0 if 'size' in columns else 0,
+               'ETag': (record[columns['e_tag']] or '').strip('"') if 'e_tag' in columns else '',
+               'LastModified': str(record[columns['last_modified_date']]) if 'last_modified_date' in columns else ''}
+
+def read_key_list(path, bucket):
+    s3_prefix = 's3://%s/' % (bucket)
+    with open_text(path) as file:
+        for line in file:
+            line = line.rstrip('\n')
+            if not line.strip():
+                continue
+            size = 0
+            match = re_ls_line.match(line)
+            if match:
+                size, line = int(match.group(1)), match.group(2)
+            elif line.startswith(s3_prefix):
+                line = line[len(s3_prefix):]
+            yield {'Key': line, 'Size': size, 'ETag': '', 'LastModified': ''}
+
+def inventory_data_path(manifest_path, key):
+    # S3 Inventory writes <config-id>/<timestamp>/manifest.json and its data files under <config-id>/data/.
+    directory = os.path.dirname(os.path.abspath(manifest_path))
+    filename = key.split('/')[-1]
+    candidates = [os.path.join(directory, os.pardir, 'data', filename), os.path.join(directory, 'data', filename)]
+    # files[].key is the full destination key, so a mirror of the whole destination bucket has it below one of the manifest's parents.
+    while True:
+        candidates.append(os.path.join(directory, *key.split('/')))
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            return os.path.normpath(candidate)
+    raise FileNotFoundError('Inventory data file %s not found in ../data/ or data/ next to %s, or in a mirror of its destination bucket' % (key, manifest_path))
+
+def read_inventory_manifest(path, bucket):
+    with open(path, 'r') as file:
+        manifest = json.load(file)
+    file_format = manifest.get('fileFormat', 'CSV').upper()
+    schema = manifest.get('fileSchema', '')
+    for data_file in manifest.get('files', []):
+        data_path = inventory_data_path(path, data_file['key'])
+        if file_format == 'PARQUET':
+            yield from read_inventory_parquet(data_path, bucket)
+        else:
+            yield from read_inventory_csv(data_path, schema.split(','), bucket)
+
+def read_inventory(path, bucket = 'genomeark'):
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.json'):
+        return read_inventory_manifest(path, bucket)
+    if name.endswith('.parquet'):
+        return read_inventory_parquet(path, bucket)
+    if name.endswith('.csv'):
+        return read_inventory_csv(path, default_schema, bucket)
+    return read_key_list(path, bucket)
+
+def load_inventory(path, bucket = 'genomeark', prefix = 'species/'):
+    index = PrefixIndex()
+    for object in read_inventory(path, bucket = bucket):
+        if object['Key'].startswith(prefix):
+            index.add(object)
+    print('Loaded %i objects from inventory %s' % (len(index), path))
+    return index
@@ -0,0 +1,62 @@
+import json
+import os
+import threading
+
+class Journal:
+    def __init__(self, filename, resume = False):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._offsets = dict()
+        if resume and os.path.exists(filename):
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+            open(filename, 'w').close()
+        self._out = open(filename, 'ab')
+
+    def _load(self):
+        with open(self.filename, 'rb') as file:
+            offset = 0
+            for line in file:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError
+                    entry = json.loads(line)
+                except ValueError:
+                    # A run killed mid-write leaves a truncated last line; that pass is simply redone.
+                    break
+                self._offsets[self.key(entry['tolid'], entry['pass'], entry['species'], entry['biosample'], entry.get('columns', ()))] = offset
+                offset += len(line)
+        with open(self.filename, 'r+b') as file:
+            file.truncate(offset)
+        print('Resuming from %s: %i finished passes' % (self.filename, len(self._offsets)))
+
+    @staticmethod
+    def key(tolid, metadata_pass, species, biosample_accession, columns):
+        # Rows recorded with other columns (e.g. without --checksums) cannot be reused, so the pass is redone.
+        return (tolid, metadata_pass, species, biosample_accession, tuple(columns))
+
+    def __contains__(self, key):
+        return key in self._offsets
+
+    def result(self, key):
+        with open(self.filename, 'rb') as file:
+            file.seek(self._offsets[key])
+            entry = json.loads(file.readline())
+        # Orphans are kept so a resumed --validate run fails on the same unpaired reads as the run that recorded them.
+        return [tuple(row) for row in entry['rows']], [(location, orphans) for location, orphans in entry.get('orphans', [])]
+
+    def record(self, key, rows, orphans = (), output = None):
+        tolid, metadata_pass, species, biosample_accession, columns = key
+        line = json.dumps({'tolid': tolid, 'pass': metadata_pass, 'species': species, 'biosample': biosample_accession,
+                           'columns': list(columns), 'output': output, 'rows': [(key, dict(row)) for key, row in rows], 'orphans': list(orphans)})
+        with self._lock:
+            offset = self._out.tell()
+            self._out.write(line.encode() + b'\n')
+            self._out.flush()
+            os.fsync(self._out.fileno())
+            self._offsets[key] = offset
+
+    def close(self):
+        with self._lock:
+            self._out.close()
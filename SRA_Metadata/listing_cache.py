@@ -0,0 +1,120 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+schema = '''
+CREATE TABLE IF NOT EXISTS listings (
+    id INTEGER PRIMARY KEY,
+    bucket TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    delimiter TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    entries INTEGER NOT NULL,
+    UNIQUE (bucket, prefix, delimiter)
+);
+CREATE TABLE IF NOT EXISTS objects (
+    listing_id INTEGER NOT NULL REFERENCES listings(id) ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    size INTEGER,
+    etag TEXT,
+    last_modified TEXT
+);
+CREATE TABLE IF NOT EXISTS prefixes (
+    listing_id INTEGER NOT NULL REFERENCES listings(id) ON DELETE CASCADE,
+    prefix TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_listing ON objects(listing_id);
+CREATE INDEX IF NOT EXISTS prefixes_listing ON prefixes(listing_id);
+CREATE INDEX IF NOT EXISTS listings_accessed ON listings(accessed_at);
+'''
+
+class ListingCache:
+    def __init__(self, cache_dir, ttl = 24 * 3600, max_entries = 1000000, refresh = False):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, 'listings.sqlite')
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread = False)
+        self._connection.execute('PRAGMA foreign_keys = ON')
+        self._connection.execute('PRAGMA journal_mode = WAL')
+        self._connection.executescript(schema)
+
+    def get(self, bucket, prefix, delimiter):
+        if self.refresh:
+            return None
+        now = time.time()
+        with self._lock:
+            listing = self._connection.execute(
+                'SELECT id, fetched_at FROM listings WHERE bucket = ? AND prefix = ? AND delimiter = ?',
+                (bucket, prefix, delimiter or '')).fetchone()
+            if listing is None:
+                return None
+            listing_id, fetched_at = listing
+            if self.ttl is not None and now - fetched_at > self.ttl:
+                return None
+            dirs = [row[0] for row in self._connection.execute(
+                'SELECT prefix FROM prefixes WHERE listing_id = ? ORDER BY rowid', (listing_id,))]
+            objects = [{'Key': key, 'Size': size, 'ETag': etag, 'LastModified': last_modified}
+                       for key, size, etag, last_modified in self._connection.execute(
+                           'SELECT key, size, etag, last_modified FROM objects WHERE listing_id = ? ORDER BY rowid', (listing_id,))]
+            with self._connection:
+                self._connection.execute('UPDATE listings SET accessed_at = ? WHERE id = ?', (now, listing_id))
+        return dirs, objects
+
+    def put(self, bucket, prefix, delimiter, dirs, objects):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                'DELETE FROM listings WHERE bucket = ? AND prefix = ? AND delimiter = ?', (bucket, prefix, delimiter or ''))
+            listing_id = self._connection.execute(
+                'INSERT INTO listings (bucket, prefix, delimiter, fetched_at, accessed_at, entries) VALUES (?, ?, ?, ?, ?, ?)',
+                (bucket, prefix, delimiter or '', now, now, len(dirs) + len(objects))).lastrowid
+            self._connection.executemany('INSERT INTO prefixes (listing_id, prefix) VALUES (?, ?)',
+                                         ((listing_id, dir) for dir in dirs))
+            self._connection.executemany(
+                'INSERT INTO objects (listing_id, key, size, etag, last_modified) VALUES (?, ?, ?, ?, ?)',
+                ((listing_id, object['Key'], object['Size'], object['ETag'], object['LastModified']) for object in objects))
+            self._evict()
+
+    def _evict(self):
+        total = self._connection.execute('SELECT COALESCE(SUM(entries), 0) FROM listings').fetchone()[0]
+        if total <= self.max_entries:
+            return
+        for listing_id, entries in self._connection.execute(
+                'SELECT id, entries FROM listings ORDER BY accessed_at').fetchall():
+            self._connection.execute('DELETE FROM listings WHERE id = ?', (listing_id,))
+            total -= entries
+            if total <= self.max_entries:
+                break
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+class ETagCache:
+    def __init__(self, cache_dir, name):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.table = name
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(cache_dir, 'listings.sqlite'), check_same_thread = False)
+        self._connection.execute('PRAGMA journal_mode = WAL')
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS %s (etag TEXT PRIMARY KEY, value TEXT NOT NULL)' % (self.table))
+
+    def get(self, etag):
+        with self._lock:
+            row = self._connection.execute('SELECT value FROM %s WHERE etag = ?' % (self.table), (etag,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, etag, value):
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO %s (etag, value) VALUES (?, ?)' % (self.table), (etag, json.dumps(value)))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
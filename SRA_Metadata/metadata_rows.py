@@ -0,0 +1,56 @@
+import sys
+from collections.abc import Mapping
+
+metadata_fieldnames = ['biosample_accession', 'library_ID', 'title', 'library_strategy', 'library_source', 'library_selection',
+                       'library_layout', 'platform', 'instrument_model', 'design_description', 'filetype', 'filename', 'filename2',
+                       'filename3', 'filename4', 'assembly', 'fasta_file']
+
+# Columns that only depend on the platform template; every row of a library points at one shared tuple of them.
+template_fieldnames = ('library_strategy', 'library_source', 'library_selection', 'library_layout', 'platform',
+                       'design_description', 'filetype', 'assembly')
+template_positions = {column: position for position, column in enumerate(template_fieldnames)}
+row_fields = ('biosample_accession', 'library_ID', 'title', 'instrument_model', 'filename', 'filename2')
+empty_fields = ('filename3', 'filename4', 'fasta_file')
+
+_templates = dict()
+
+def row_template(metadata, filetype, assembly = '', design_description = None):
+    template = (metadata['library_strategy'], metadata['library_source'], metadata['library_selection'], metadata['library_layout'],
+                metadata['platform'], design_description or metadata['design_description'], filetype, assembly)
+    return _templates.setdefault(template, template)
+
+# Reads like a dict for csv.DictWriter, but only holds the fields that vary between files.
+class MetadataRow(Mapping):
+    __slots__ = ('template',) + row_fields + ('extra',)
+
+    def __init__(self, template, biosample_accession, library_ID, title, instrument_model, filename, filename2 = '', extra = None):
+        self.template = template
+        self.biosample_accession = biosample_accession
+        self.library_ID = sys.intern(library_ID)
+        self.title = sys.intern(title)
+        self.instrument_model = sys.intern(instrument_model)
+        self.filename = filename
+        self.filename2 = filename2
+        self.extra = extra or None
+
+    def __getitem__(self, column):
+        if column in template_positions:
+            return self.template[template_positions[column]]
+        if column in row_fields:
+            return getattr(self, column)
+        if column in empty_fields:
+            return ''
+        if self.extra and column in self.extra:
+            return self.extra[column]
+        raise KeyError(column)
+
+    def __iter__(self):
+        yield from metadata_fieldnames
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return len(metadata_fieldnames) + len(self.extra or ())
+
+    def __repr__(self):
+        return 'MetadataRow(%r)' % (dict(self))
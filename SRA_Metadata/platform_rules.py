@@ -0,0 +1,88 @@
+import json
+import os
+import re
+
+default_rules_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'platform_rules.json')
+
+def read_rules(path = default_rules_path):
+    with open(path, 'r') as file:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError('Reading YAML platform rules requires PyYAML (pip install pyyaml)')
+            return yaml.safe_load(file)
+        return json.load(file)
+
+class PlatformRule:
+    def __init__(self, section, rule, templates, builders):
+        self.section = section
+        self.folders = rule.get('folders', [])
+        self.pattern = re.compile(rule['pattern']) if rule.get('pattern') else None
+        name = ', '.join(self.folders) or rule.get('pattern', '?')
+        if rule.get('builder') not in builders:
+            raise ValueError('Unknown builder %r in %s rule for %s' % (rule.get('builder'), section, name))
+        self.builder = rule['builder']
+        self.build = builders[rule['builder']]
+        # Without an explicit template, each folder uses the metadata_dict entry named after it, e.g. arima or 10x.
+        self.templates = templates
+        self.metadata_name = rule.get('metadata')
+        # A pattern can match any folder name, so there is no folder-named template to fall back on.
+        if self.pattern is not None and not self.metadata_name and rule['builder'] != 'pacbio_movies':
+            raise ValueError('Pattern %s rule for %s needs a metadata template' % (section, name))
+        for template in [self.metadata_name] if self.metadata_name else [folder.lower() for folder in self.folders]:
+            if template not in templates and rule['builder'] != 'pacbio_movies':
+                raise ValueError('Unknown metadata template %r in %s rule for %s' % (template, section, name))
+        for field in ('library_id', 'title'):
+            if field not in rule:
+                raise ValueError('Missing %s in %s rule for %s' % (field, section, name))
+        # Movie builders number libraries per movie; every other builder takes its numbers from the rule's counter.
+        if '{number}' in rule['library_id'] and not rule.get('counter') and rule['builder'] != 'pacbio_movies':
+            raise ValueError('library_id %r in %s rule for %s uses {number} but the rule has no counter' % (rule['library_id'], section, name))
+        self.library_id = rule['library_id']
+        self.title = rule['title']
+        self.filetype = rule.get('filetype', '')
+        self.assembly = rule.get('assembly', '')
+        self.extensions = tuple(rule.get('extensions', ()))
+        self.counter = tuple(rule['counter']) if rule.get('counter') else None
+        self.design_descriptions = rule.get('design_descriptions', {})
+
+    def metadata(self, folder):
+        return self.templates[self.metadata_name or folder.lower()]
+
+    def design_description(self, instrument, metadata):
+        return self.design_descriptions.get(instrument, self.design_descriptions.get('*', metadata['design_description']))
+
+class RuleTable:
+    def __init__(self, rules, includes):
+        self.index = dict()
+        self.patterns = []
+        self.includes = includes
+        for rule in rules:
+            for folder in rule.folders:
+                self.index.setdefault((rule.section, folder), rule)
+            if rule.pattern is not None:
+                self.patterns.append(rule)
+
+    def lookup(self, section, folder):
+        rule = self.index.get((section, folder))
+        if rule is None:
+            rule = next((rule for rule in self.patterns if rule.section == section and rule.pattern.match(folder)), None)
+            # Folders matched by pattern are remembered, so every later ToLID resolves them with one dict lookup.
+            self.index[(section, folder)] = rule
+        return rule
+
+    def included(self, section, filename):
+        includes = self.includes.get(section)
+        return not includes or any(include in filename for include in includes)
+
+def compile_rules(document, metadata, builders):
+    templates = dict(metadata)
+    templates.update(document.get('templates', {}))
+    rules = []
+    includes = dict()
+    for section in ('genomic', 'transcriptomic'):
+        config = document.get(section, {})
+        includes[section] = tuple(config.get('include', ()))
+        rules.extend(PlatformRule(section, rule, templates, builders) for rule in config.get('rules', []))
+    return RuleTable(rules, includes)
@@ -0,0 +1,111 @@
+import functools
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.trace = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+        self.stages = defaultdict(lambda: [0, 0.0])
+        self.counters = defaultdict(int)
+        self.events = []
+
+    def enable(self, trace = False):
+        self.enabled = True
+        self.trace = trace
+        self._origin = time.perf_counter()
+
+    @property
+    def tolid(self):
+        return getattr(self._local, 'tolid', '')
+
+    @contextmanager
+    def tolid_context(self, tolid):
+        previous = self.tolid
+        self._local.tolid = tolid
+        try:
+            yield
+        finally:
+            self._local.tolid = previous
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            tolid = self.tolid
+            with self._lock:
+                totals = self.stages[(tolid, name)]
+                totals[0] += 1
+                totals[1] += end - start
+                if self.trace:
+                    self.events.append({'name': name, 'ph': 'X', 'pid': 0, 'tid': threading.get_ident(),
+                                        'ts': (start - self._origin) * 1e6, 'dur': (end - start) * 1e6,
+                                        'args': {'tolid': tolid}})
+
+    def count(self, name, value = 1):
+        if self.enabled:
+            with self._lock:
+                self.counters[(self.tolid, name)] += value
+
+    def summary(self):
+        stages = defaultdict(lambda: {'calls': 0, 'seconds': 0.0})
+        counters = defaultdict(int)
+        tolids = defaultdict(lambda: defaultdict(float))
+        with self._lock:
+            for (tolid, name), (calls, seconds) in self.stages.items():
+                stages[name]['calls'] += calls
+                stages[name]['seconds'] += seconds
+                if tolid:
+                    tolids[tolid]['%s_seconds' % (name)] += seconds
+            for (tolid, name), value in self.counters.items():
+                counters[name] += value
+                if tolid:
+                    tolids[tolid][name] += value
+        return {'stages': dict(stages), 'counters': dict(counters), 'tolids': {tolid: dict(values) for tolid, values in tolids.items()}}
+
+    def print_summary(self):
+        summary = self.summary()
+        print('%-28s %10s %12s %12s' % ('stage', 'calls', 'total (s)', 'mean (ms)'))
+        for name, totals in sorted(summary['stages'].items(), key = lambda item: -item[1]['seconds']):
+            print('%-28s %10i %12.3f %12.3f' % (name, totals['calls'], totals['seconds'], 1000 * totals['seconds'] / max(1, totals['calls'])))
+        for name, value in sorted(summary['counters'].items()):
+            print('%-28s %10i' % (name, value))
+        if summary['tolids']:
+            columns = sorted({column for values in summary['tolids'].values() for column in values})
+            print('\t'.join(['ToLID'] + columns))
+            for tolid in sorted(summary['tolids']):
+                values = summary['tolids'][tolid]
+                print('\t'.join([tolid] + ['%.3f' % (values.get(column, 0)) if column.endswith('_seconds') else '%i' % (values.get(column, 0)) for column in columns]))
+
+    def write(self, filename):
+        report = self.summary()
+        if self.trace:
+            report['traceEvents'] = self.events
+        with open(filename, 'w') as out:
+            json.dump(report, out, indent = 1)
+        print('Profile saved to %s' % (filename))
+
+profiler = Profiler()
+
+def profiled(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            with profiler.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
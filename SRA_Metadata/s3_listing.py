@@ -0,0 +1,136 @@
+import threading
+from collections import defaultdict
+
+import boto3
+from botocore.config import Config
+
+from profiling import profiled, profiler
+
+s3_config = {
+    'max_pool_connections': 10,
+    'connect_timeout': 10,
+    'read_timeout': 60,
+    'max_attempts': 8,
+}
+
+_client = None
+_client_lock = threading.Lock()
+_listing_cache = None
+
+def configure_s3(max_pool_connections = None, connect_timeout = None, read_timeout = None, max_attempts = None):
+    global _client
+    settings = {'max_pool_connections': max_pool_connections,
+                'connect_timeout': connect_timeout,
+                'read_timeout': read_timeout,
+                'max_attempts': max_attempts}
+    with _client_lock:
+        for name, value in settings.items():
+            if value is not None:
+                s3_config[name] = value
+        _client = None
+
+def set_s3_client(client):
+    global _client
+    with _client_lock:
+        _client = client
+
+def set_listing_cache(cache):
+    global _listing_cache
+    _listing_cache = cache
+
+def get_s3_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                config = Config(max_pool_connections = s3_config['max_pool_connections'],
+                                connect_timeout = s3_config['connect_timeout'],
+                                read_timeout = s3_config['read_timeout'],
+                                # Adaptive mode is the only retry layer: it backs off on SlowDown and rate-limits the shared client for every worker.
+                                retries = {'max_attempts': s3_config['max_attempts'], 'mode': 'adaptive'})
+                _client = boto3.client('s3', config = config)
+    return _client
+
+def list_objects(prefix, bucket = 'genomeark', delimiter = '/'):
+    cache = _listing_cache
+    if cache is not None:
+        cached = cache.get(bucket, prefix, delimiter)
+        if cached is not None:
+            profiler.count('cached_listings')
+            return cached
+    s3 = get_s3_client()
+    request = {'Bucket': bucket, 'Prefix': prefix}
+    if delimiter:
+        request['Delimiter'] = delimiter
+    dirs = []
+    objects = []
+    while True:
+        response = s3.list_objects_v2(**request)
+        profiler.count('s3_requests')
+        dirs.extend(object['Prefix'] for object in response.get('CommonPrefixes', []))
+        objects.extend({'Key': object['Key'],
+                        'Size': object.get('Size', 0),
+                        'ETag': object.get('ETag', '').strip('"'),
+                        'LastModified': str(object.get('LastModified', ''))}
+                       for object in response.get('Contents', []))
+        if not response.get('IsTruncated'):
+            break
+        request['ContinuationToken'] = response['NextContinuationToken']
+    profiler.count('objects_listed', len(objects))
+    profiler.count('object_bytes', sum(object['Size'] for object in objects))
+    if cache is not None:
+        cache.put(bucket, prefix, delimiter, dirs, objects)
+    return dirs, objects
+
+class S3Listing:
+    def __init__(self, bucket = 'genomeark'):
+        self.bucket = bucket
+
+    @profiled('get_s3_dirs')
+    def dirs(self, prefix):
+        dirs, _ = list_objects(prefix, bucket = self.bucket)
+        return dirs
+
+    @profiled('get_s3_files')
+    def objects(self, prefix):
+        _, objects = list_objects(prefix, bucket = self.bucket)
+        return objects
+
+    def files(self, prefix):
+        return [object['Key'] for object in self.objects(prefix)]
+
+class PrefixIndex:
+    def __init__(self, objects = ()):
+        self._objects = defaultdict(list)
+        self._dirs = defaultdict(set)
+        for object in objects:
+            self.add(object)
+
+    def add(self, object):
+        parent = object['Key'].rpartition('/')[0]
+        parent = parent + '/' if parent else ''
+        self._objects[parent].append(object)
+        while parent:
+            grandparent = parent[:-1].rpartition('/')[0]
+            grandparent = grandparent + '/' if grandparent else ''
+            if parent in self._dirs[grandparent]:
+                break
+            self._dirs[grandparent].add(parent)
+            parent = grandparent
+
+    def __len__(self):
+        return sum(len(objects) for objects in self._objects.values())
+
+    def dirs(self, prefix):
+        return sorted(self._dirs.get(prefix, ()))
+
+    def objects(self, prefix):
+        return sorted(self._objects.get(prefix, ()), key = lambda object: object['Key'])
+
+    def files(self, prefix):
+        return [object['Key'] for object in self.objects(prefix)]
+
+@profiled('get_s3_tree')
+def list_tree(prefix, bucket = 'genomeark'):
+    _, objects = list_objects(prefix, bucket = bucket, delimiter = None)
+    return PrefixIndex(objects)
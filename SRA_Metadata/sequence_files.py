@@ -0,0 +1,84 @@
+import re
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from profiling import profiled
+
+# An explicit R1/R2 token wins; a bare _1/_2 is only the read number when the name has no R token, so chunked names like s_R1_2 stay R1.
+re_read_file = re.compile('^(?P<stem>.*)(?P<separator>[._])(?P<tag>R)(?P<read>[12])(?P<suffix>(?:[._][^/]*)?\\.(?:fastq|fq)\\.gz)$')
+re_bare_read_file = re.compile('^(?P<stem>.*)(?P<separator>[._])(?P<tag>)(?P<read>[12])(?P<suffix>(?:_[0-9]+)?\\.(?:fastq|fq)\\.gz)$')
+read_extensions = ('.fastq.gz', '.fq.gz')
+
+@profiled('pairing')
+def pair_reads(filepaths):
+    mates = dict()
+    orphans = []
+    for filepath in filepaths:
+        if not filepath.endswith(read_extensions):
+            continue
+        match = re_read_file.match(filepath) or re_bare_read_file.match(filepath)
+        if not match:
+            orphans.append(filepath)
+            continue
+        key = match.group('stem', 'separator', 'tag', 'suffix')
+        if key not in mates:
+            mates[key] = [None, None]
+        mates[key][int(match.group('read')) - 1] = filepath
+    pairs = []
+    for forward_read, reverse_read in mates.values():
+        if forward_read and reverse_read:
+            pairs.append((forward_read, reverse_read))
+        else:
+            orphans.append(forward_read or reverse_read)
+    return pairs, orphans
+
+_orphans = threading.local()
+
+@contextmanager
+def collect_orphans():
+    # Passes run on worker threads, so each one only collects the orphans reported while it builds its own rows.
+    previous = getattr(_orphans, 'collected', None)
+    _orphans.collected = collected = []
+    try:
+        yield collected
+    finally:
+        _orphans.collected = previous
+
+def report_orphans(orphans, location):
+    if orphans:
+        print('Unpaired reads in %s: %s' % (location, ', '.join(orphans)))
+        collected = getattr(_orphans, 'collected', None)
+        if collected is not None:
+            collected.append((location, list(orphans)))
+
+re_pacbio_file = re.compile(
+    '^(?=(?P<tag>(?P<movie>[^._]*)[^.]*)\\.)(?:'
+    '(?P<fastq>(?=[^.]*\\..*hifi_reads)(?=[^.]*\\..*\\.fastq\\.gz).*)|'
+    '(?=[^.]*\\..*\\.bam)(?:'
+    '(?P<demultiplex_bam>.*(?P<barcode>bc[0-9]{4}--bc[0-9]{4})\\.bam)|'
+    '(?P<subreads>.*subreads\\.bam)|'
+    '(?P<reads>.*\\.reads\\.bam)|'
+    '(?P<with_5mC>.*with_5mC\\.bam)|'
+    '(?P<hifi_bam>.*hifi_reads\\.(?:(?P<hifi_barcode>bc[0-9]{4})\\.)?bam)'
+    '))$')
+pacbio_filetypes = {'fastq': 'fastq',
+                    'demultiplex_bam': 'demultiplex_bam',
+                    'subreads': 'subreads',
+                    'reads': 'reads',
+                    'with_5mC': '5mC',
+                    'hifi_bam': 'hifi_bam'}
+
+PacBioFile = namedtuple('PacBioFile', ['filetype', 'metadata_tag', 'movie', 'instrument', 'barcode'])
+
+@profiled('classification')
+def classify_pacbio_file(filename, instruments, default_instrument = 'Sequel II'):
+    match = re_pacbio_file.match(filename)
+    if not match:
+        return None
+    movie = match.group('movie')
+    return PacBioFile(pacbio_filetypes[match.lastgroup],
+                      match.group('tag'),
+                      movie,
+                      instruments.get(movie, default_instrument),
+                      match.group('barcode') or match.group('hifi_barcode'))
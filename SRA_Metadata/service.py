@@ -0,0 +1,145 @@
+import ipaddress
+import json
+import os
+import socket
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from batch_metadata import check_batch_options, check_shard, process_metadata, process_single, shard_suffix
+from header_probe import get_header_probe
+from journal import Journal
+from validation import BatchValidator
+
+def is_loopback(host):
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except socket.gaierror:
+        return False
+    return bool(addresses) and all(ipaddress.ip_address(address.split('%')[0]).is_loopback for address in addresses)
+
+class RequestError(Exception):
+    pass
+
+class MetadataService:
+    def __init__(self, recursive = False, index = None, submitted = None, root = None):
+        self.recursive = recursive
+        self.index = index
+        self.submitted = submitted
+        # Requests are not authenticated, so every file they read or write must resolve inside this directory.
+        self.root = os.path.realpath(root or os.getcwd())
+        # Two batches writing the same consolidated sheets or journal would clobber each other, so they run one at a time per output directory.
+        self._locks = dict()
+        self._locks_lock = threading.Lock()
+
+    def _output_lock(self, output_dir):
+        with self._locks_lock:
+            return self._locks.setdefault(output_dir, threading.Lock())
+
+    def _path(self, request, name, default = None):
+        value = request.get(name, default)
+        if value is None:
+            return None
+        path = os.path.realpath(os.path.join(request.get('cwd', self.root), value))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise PermissionError('%s is outside the service root %s' % (value, self.root))
+        return path
+
+    def _reset_probe(self):
+        probe = get_header_probe()
+        if probe is not None:
+            probe.reset()
+
+    def single(self, request):
+        self._reset_probe()
+        output_dir = self._path(request, 'output_dir', 'submission_metadata')
+        validator = BatchValidator() if request.get('validate') else None
+        with self._output_lock(output_dir):
+            files = process_single(request['species'], request['tolid'], request['biosample'],
+                                   genomic = request.get('genome', False), transcriptomic = request.get('transcriptome', False),
+                                   recursive = self.recursive, index = self.index, submitted = self.submitted, output_dir = output_dir,
+                                   validator = validator)
+        return {'files': files, 'problems': validator.validate() if validator else []}
+
+    @staticmethod
+    def _batch_options(request):
+        # Requests get the same checks as the batch command line, answered with a 400 instead of failing part way through.
+        shard = None
+        if request.get('shard'):
+            try:
+                shard, shards = (int(number) for number in request['shard'])
+            except (TypeError, ValueError):
+                raise RequestError('shard must look like [i, N], e.g. [2, 4]')
+        try:
+            jobs = int(request.get('jobs', 1))
+            max_rows = int(request['max_rows']) if request.get('max_rows') is not None else None
+            if shard is not None:
+                shard = check_shard(shard, shards)
+            check_batch_options(jobs, max_rows, request.get('consolidate', False))
+        except (TypeError, ValueError) as error:
+            raise RequestError(str(error))
+        return shard, jobs, max_rows
+
+    def batch(self, request):
+        shard, jobs, max_rows = self._batch_options(request)
+        self._reset_probe()
+        output_dir = self._path(request, 'output_dir', 'submission_metadata')
+        journal_filename = self._path(request, 'journal')
+        if journal_filename is None and request.get('resume'):
+            journal_filename = os.path.join(output_dir, 'batch_journal%s.jsonl' % (shard_suffix(shard)))
+        validator = BatchValidator() if request.get('validate') else None
+        with self._output_lock(output_dir):
+            journal = Journal(journal_filename, resume = request.get('resume', False)) if journal_filename else None
+            process_metadata(self._path(request, 'filename'), genomic = request.get('genome', False), transcriptomic = request.get('transcriptome', False),
+                             recursive = self.recursive, jobs = jobs, index = self.index,
+                             consolidate = request.get('consolidate', False), max_rows = max_rows,
+                             output_dir = output_dir, journal = journal, shard = shard, submitted = self.submitted,
+                             validator = validator)
+        return {'output_dir': output_dir, 'problems': validator.validate() if validator else []}
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._reply(200, {'status': 'ok'})
+        else:
+            self._reply(404, {'error': 'unknown path %s' % (self.path)})
+
+    def do_POST(self):
+        handlers = {'/single': self.service.single, '/batch': self.service.batch}
+        if self.path not in handlers:
+            self._reply(404, {'error': 'unknown path %s' % (self.path)})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            self._reply(200, handlers[self.path](request))
+        except RequestError as error:
+            self._reply(400, {'error': str(error)})
+        except PermissionError as error:
+            self._reply(403, {'error': str(error)})
+        except Exception as error:
+            traceback.print_exc()
+            self._reply(500, {'error': '%s: %s' % (type(error).__name__, error)})
+
+def serve(host = '127.0.0.1', port = 8765, recursive = False, index = None, submitted = None, root = None):
+    if not is_loopback(host):
+        raise ValueError('Refusing to serve on %s: the service has no authentication, so it only listens on loopback addresses' % (host))
+    service = MetadataService(recursive = recursive, index = index, submitted = submitted, root = root)
+    handler = type('BoundServiceHandler', (ServiceHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    print('Serving SRA metadata requests on http://%s:%i for files under %s' % (host, port, service.root))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
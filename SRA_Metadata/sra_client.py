@@ -0,0 +1,76 @@
+import argparse
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+def parse_args():
+    parser = argparse.ArgumentParser(description = 'Send single or batch requests to a running `SRA_metadata.py serve` instance')
+    parser.add_argument(
+        '--server', default = os.environ.get('SRA_METADATA_SERVER', 'http://127.0.0.1:8765'), help = 'Service URL (default: $SRA_METADATA_SERVER or http://127.0.0.1:8765)'
+    )
+    parser.add_argument(
+        '-g', '--genome', action = 'store_true', help = 'Generate genome sequence metadata'
+    )
+    parser.add_argument(
+        '-tx', '--transcriptome', action = 'store_true', help = 'Generate transcriptome metadata'
+    )
+    parser.add_argument(
+        '-o', '--output-dir', default = 'submission_metadata', help = 'Output directory (default: submission_metadata)'
+    )
+    parser.add_argument(
+        '--validate', action = 'store_true', help = 'Check all rows for duplicate files, unpaired reads and library_ID collisions before writing; nothing is written if any are found'
+    )
+    subparsers = parser.add_subparsers(dest = 'mode', required = True)
+    single_entry = subparsers.add_parser('single')
+    single_entry.add_argument(
+        '-b', '--biosample', help = 'BioSample Accession', required = True
+    )
+    single_entry.add_argument(
+        '-t', '--tolid', help = 'ToLID', required = True
+    )
+    single_entry.add_argument(
+        '-s', '--species', help = 'Species name in latin (e.g. Homo_sapiens)', required = True
+    )
+    batch_entry = subparsers.add_parser('batch')
+    batch_entry.add_argument(
+        '-f', '--filename', help = '.csv file containing species information', required = True
+    )
+    batch_entry.add_argument(
+        '-j', '--jobs', type = int, default = 1, help = 'Number of ToLID listings to run concurrently (default: 1)'
+    )
+    batch_entry.add_argument(
+        '-c', '--consolidate', action = 'store_true', help = 'Stream all rows into one sequence and one transcriptome TSV instead of one file per ToLID'
+    )
+    batch_entry.add_argument(
+        '--max-rows', type = int, help = 'Start a new consolidated TSV part after this many rows'
+    )
+    batch_entry.add_argument(
+        '--journal', help = 'Append each finished ToLID pass and its rows to this checkpoint journal'
+    )
+    batch_entry.add_argument(
+        '--resume', action = 'store_true', help = 'Skip passes already recorded in the journal'
+    )
+    return parser.parse_args()
+
+def send_request(server, mode, request):
+    http_request = urllib.request.Request('%s/%s' % (server.rstrip('/'), mode), data = json.dumps(request).encode(),
+                                          headers = {'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(http_request) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as error:
+        sys.exit('Request failed: %s' % (json.load(error).get('error', error.reason)))
+
+if __name__ == '__main__':
+    args = parse_args()
+    request = {key: value for key, value in vars(args).items() if key not in ('server', 'mode')}
+    request['cwd'] = os.getcwd()
+    response = send_request(args.server, args.mode, request)
+    for filename in response.get('files', []):
+        print('Metadata saved to %s' % (filename))
+    for problem in response.get('problems', []):
+        print(problem)
+    if response.get('problems'):
+        sys.exit(1)
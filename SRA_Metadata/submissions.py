@@ -0,0 +1,57 @@
+import csv
+import os
+from collections import defaultdict
+
+class SubmissionIndex:
+    def __init__(self):
+        self.filenames = set()
+        self.basenames = defaultdict(set)
+        self.library_numbers = dict()
+        self.metadata_tags = defaultdict(dict)
+
+    @classmethod
+    def load(cls, directory):
+        index = cls()
+        sheets = 0
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for file in sorted(files):
+                if file.endswith('.tsv'):
+                    index.add_sheet(os.path.join(root, file))
+                    sheets += 1
+        print('Loaded %i submitted files from %i sheets in %s' % (len(index.filenames) + sum(map(len, index.basenames.values())), sheets, directory))
+        return index
+
+    def add_sheet(self, filename):
+        with open(filename, 'r', newline = '') as file:
+            for row in csv.DictReader(file, delimiter = '\t'):
+                self.add_row(row)
+
+    def add_row(self, row):
+        tolid = row.get('library_ID', '').split('_', 1)[0]
+        for column in ('filename', 'filename2'):
+            if not row.get(column):
+                continue
+            # Hand-made sheets may list bare file names, which only match files of the ToLID named by their library_ID.
+            if '/' in row[column]:
+                self.filenames.add(row[column])
+            elif tolid:
+                self.basenames[tolid].add(row[column])
+        library, _, number = row.get('library_ID', '').rpartition('_')
+        if not number.isdigit():
+            return
+        number = int(number)
+        if number > self.library_numbers.get(library, 0):
+            self.library_numbers[library] = number
+        if row.get('platform') == 'PACBIO_SMRT' and row.get('filename'):
+            metadata_tag = os.path.basename(row['filename']).split('.', 1)[0]
+            self.metadata_tags[tolid].setdefault(metadata_tag, number)
+
+    def is_submitted(self, filepath, tolid):
+        return filepath in self.filenames or os.path.basename(filepath) in self.basenames.get(tolid, ())
+
+    def next_library_number(self, tolid, libraries):
+        return max(self.library_numbers.get('%s_%s' % (tolid, library), 0) for library in libraries) + 1
+
+    def library_numbers_for(self, tolid):
+        return dict(self.metadata_tags.get(tolid, {}))
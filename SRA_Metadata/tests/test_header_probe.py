@@ -0,0 +1,46 @@
+import gzip
+
+from botocore.exceptions import ClientError
+
+from header_probe import HeaderProbe, inflate, parse_bam_header, parse_fastq_header, same_platform
+from s3_listing import set_s3_client
+
+def bam_header(text):
+    return inflate(gzip.compress(b'BAM\x01' + len(text).to_bytes(4, 'little') + text))
+
+def test_miniseq_is_not_miseq():
+    assert parse_fastq_header(b'@MN01234:12:000H3:1:11101:1:1 1:N:0\n')['instrument_model'] == 'Illumina MiniSeq'
+    assert parse_fastq_header(b'@M01234:12:000H3:1:11101:1:1 1:N:0\n')['instrument_model'] == 'Illumina MiSeq'
+
+def test_bam_read_group():
+    header = parse_bam_header(bam_header(b'@HD\tVN:1.6\n@RG\tID:x\tPL:PACBIO\tPM:REVIO\tPU:m84001\n@PG\tID:ccs\n'))
+    assert header == {'instrument_model': 'Revio', 'platform': 'PACBIO'}
+
+def test_platform_must_agree_with_the_folder():
+    assert same_platform({'platform': 'PACBIO'}, 'PACBIO_SMRT')
+    assert same_platform({'platform': 'ILLUMINA'}, 'ILLUMINA')
+    assert same_platform({}, 'ILLUMINA')
+    assert not same_platform({'platform': 'PACBIO'}, 'ILLUMINA')
+
+class FailingS3Client:
+    def __init__(self):
+        self.requests = 0
+
+    def get_object(self, **request):
+        self.requests += 1
+        raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Access Denied'}}, 'GetObject')
+
+def test_unreadable_and_empty_objects_are_skipped():
+    client = FailingS3Client()
+    set_s3_client(client)
+    probe = HeaderProbe(bytes_per_file = 10, budget = 15)
+    assert probe.probe({'Key': 'x.bam', 'Size': 0}) == {}
+    assert client.requests == 0
+    assert probe.probe({'Key': 'x.bam', 'Size': 100}) == {}
+    assert client.requests == 1
+
+def test_budget_is_refilled_by_reset():
+    probe = HeaderProbe(bytes_per_file = 10, budget = 15)
+    assert probe._reserve() and not probe._reserve()
+    probe.reset()
+    assert probe._reserve()
@@ -0,0 +1,17 @@
+import gzip
+import json
+
+from inventory import read_inventory
+
+def test_manifest_in_a_mirrored_destination(tmp_path):
+    destination = tmp_path / 'inventory' / 'genomeark' / 'daily'
+    (destination / 'data').mkdir(parents = True)
+    (destination / '2024-01-01T01-00Z').mkdir()
+    with gzip.open(str(destination / 'data' / 'part1.csv.gz'), 'wt') as file:
+        file.write('"genomeark","species/A_b/aA1/genomic_data/arima/x_R1.fastq.gz","12","2024-01-01T00:00:00.000Z","abc"\n')
+        file.write('"other","species/A_b/aA1/genomic_data/arima/y_R1.fastq.gz","12","2024-01-01T00:00:00.000Z","abc"\n')
+    manifest = destination / '2024-01-01T01-00Z' / 'manifest.json'
+    manifest.write_text(json.dumps({'fileFormat': 'CSV', 'fileSchema': 'Bucket, Key, Size, LastModifiedDate, ETag',
+                                    'files': [{'key': 'inventory/genomeark/daily/data/part1.csv.gz'}]}))
+    assert [(object['Key'], object['Size']) for object in read_inventory(str(manifest))] == [
+        ('species/A_b/aA1/genomic_data/arima/x_R1.fastq.gz', 12)]
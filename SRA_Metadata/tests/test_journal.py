@@ -0,0 +1,26 @@
+import csv
+
+import batch_metadata
+import benchmark
+from checksums import ChecksumResolver, set_checksum_resolver
+from journal import Journal
+from s3_listing import set_s3_client
+
+def test_resume_with_checksums_regenerates_passes(tmp_path):
+    set_s3_client(benchmark.StubS3Client([benchmark.synthetic_object('species/A_b/aA1/genomic_data/arima/aA1_R%i.fastq.gz' % (read)) for read in (1, 2)]))
+    filename = str(tmp_path / 'batch.csv')
+    with open(filename, 'w', newline = '') as file:
+        writer = csv.DictWriter(file, fieldnames = ['ToLID', 'BioSample', 'Species'])
+        writer.writeheader()
+        writer.writerow({'ToLID': 'aA1', 'BioSample': 'SAMEA1', 'Species': 'A b'})
+    journal_filename = str(tmp_path / 'out' / 'batch_journal.jsonl')
+    batch_metadata.process_metadata(filename, True, False, consolidate = True, output_dir = str(tmp_path / 'out'), journal = Journal(journal_filename))
+    set_checksum_resolver(ChecksumResolver())
+    try:
+        batch_metadata.process_metadata(filename, True, False, consolidate = True, output_dir = str(tmp_path / 'out'),
+                                      journal = Journal(journal_filename, resume = True))
+    finally:
+        set_checksum_resolver(None)
+    with open(str(tmp_path / 'out' / 'SRA_sequence_metadata.tsv')) as file:
+        rows = list(csv.DictReader(file, delimiter = '\t'))
+    assert [bool(row['md5']) for row in rows] == [True]
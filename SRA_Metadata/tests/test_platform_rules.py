@@ -0,0 +1,94 @@
+import pytest
+
+import benchmark
+from generate_SRA_metadata import get_genome_metadata, get_transcriptome_metadata, metadata_dict, row_builders
+from platform_rules import compile_rules
+from s3_listing import set_s3_client
+from submissions import SubmissionIndex
+
+base = 'species/Aa_bb/aAaBbb1/'
+keys = ['genomic_data/arima/a_R1.fastq.gz', 'genomic_data/arima/a_R2.fastq.gz',
+        'genomic_data/dovetail/d_1.fastq.gz', 'genomic_data/dovetail/d_2.fastq.gz',
+        'genomic_data/10X/x_S1_L001_R1_001.fastq.gz', 'genomic_data/10X/x_S1_L001_R2_001.fastq.gz', 'genomic_data/10X/x_S1_L001_I1_001.fastq.gz',
+        'genomic_data/element/e_R1.fastq.gz', 'genomic_data/element/e_R2.fastq.gz',
+        'genomic_data/illumina/i_L001_R1.fastq.gz', 'genomic_data/illumina/i_L001_R2.fastq.gz',
+        'genomic_data/illumina/i_L002_R1.fastq.gz', 'genomic_data/illumina/i_L002_R2.fastq.gz', 'genomic_data/illumina/lone_R1.fq.gz',
+        'genomic_data/pacbio_hifi/m64055e_200101_000000.hifi_reads.bam', 'genomic_data/pacbio_hifi/m64055e_200101_000000.hifi_reads.fastq.gz',
+        'genomic_data/pacbio_hifi/m84091_240101_000000_s1.hifi_reads.bc2001.bam', 'genomic_data/pacbio_hifi/m54306Ue_1.subreads.bam',
+        'genomic_data/pacbio_hifi/m1.reads.bam', 'genomic_data/pacbio_hifi/m2.5mC.hifi_reads.with_5mC.bam', 'genomic_data/pacbio_hifi/readme.txt',
+        'genomic_data/ont/o.fastq.gz',
+        'transcriptomic_data/brain_stem/illumina/r_R1_001.fastq.gz', 'transcriptomic_data/brain_stem/illumina/r_R2_001.fastq.gz',
+        'transcriptomic_data/brain_stem/illumina/r3_R1_001.fastq.gz',
+        'transcriptomic_data/brain_stem/pacbio_hifi/m3.flnc.bam', 'transcriptomic_data/brain_stem/pacbio_hifi/m3.bam',
+        'transcriptomic_data/brain_stem/pacbio_hifi/m3.bam.pbi',
+        'transcriptomic_data/liver/pacbio_kinnex/k.bam', 'transcriptomic_data/liver/other/z.bam']
+
+hic = 'Aa bb Hi-C sequencing'
+linked = 'Aa bb whole genome sequencing with 10x linked reads'
+shotgun = 'Aa bb whole genome shotgun sequencing with Illumina reads'
+hifi = 'Aa bb PacBio HiFi sequencing'
+novaseq = 'Illumina NovaSeq 6000'
+
+transcriptome = [('aAaBbb1_RNAseq_brain_stem', 'transcriptomic_data/brain_stem/illumina/r_R1_001.fastq.gz', 'r_R2_001.fastq.gz', novaseq, 'Aa bb Brain stem RNA'),
+                 ('aAaBbb1_isoseq', 'transcriptomic_data/brain_stem/pacbio_hifi/m3.bam', '', 'Sequel IIe', 'Aa bb Brain_stem Iso-Seq FLNC'),
+                 ('aAaBbb1_kinnex', 'transcriptomic_data/liver/pacbio_kinnex/k.bam', '', 'Revio', 'Aa bb Liver Iso-Seq FLNC')]
+
+def summarize(file_metadata):
+    return [(row['library_ID'], row['filename'][len(base):], row['filename2'].split('/')[-1], row['instrument_model'], row['title'])
+            for row in file_metadata.values()]
+
+@pytest.fixture
+def platform_folders():
+    set_s3_client(benchmark.StubS3Client([benchmark.synthetic_object(base + key) for key in keys]))
+
+def test_every_platform_folder(platform_folders, capsys):
+    assert summarize(get_genome_metadata('Aa_bb', 'aAaBbb1', 'SAMN1')) == [
+        ('aAaBbb1_10x_1', 'genomic_data/10X/x_S1_L001_R1_001.fastq.gz', 'x_S1_L001_R2_001.fastq.gz', novaseq, linked),
+        ('aAaBbb1_HiC_2', 'genomic_data/arima/a_R1.fastq.gz', 'a_R2.fastq.gz', novaseq, hic),
+        ('aAaBbb1_HiC_3', 'genomic_data/dovetail/d_1.fastq.gz', 'd_2.fastq.gz', novaseq, hic),
+        ('aAaBbb1_HiC_4', 'genomic_data/element/e_R1.fastq.gz', 'e_R2.fastq.gz', novaseq, hic),
+        ('aAaBbb1_Illumina_1', 'genomic_data/illumina/i_L001_R1.fastq.gz', 'i_L001_R2.fastq.gz', novaseq, shotgun),
+        ('aAaBbb1_Illumina_2', 'genomic_data/illumina/i_L002_R1.fastq.gz', 'i_L002_R2.fastq.gz', novaseq, shotgun),
+        ('aAaBbb1_PacBio_reads_1', 'genomic_data/pacbio_hifi/m1.reads.bam', '', 'Sequel II', 'Aa bb PacBio sequencing'),
+        ('aAaBbb1_PacBio_HiFi_5mC_bam_2', 'genomic_data/pacbio_hifi/m2.5mC.hifi_reads.with_5mC.bam', '', 'Sequel II', hifi),
+        ('aAaBbb1_PacBio_HiFi_subreads_3', 'genomic_data/pacbio_hifi/m54306Ue_1.subreads.bam', '', 'Sequel II', hifi),
+        ('aAaBbb1_PacBio_HiFi_bam_4', 'genomic_data/pacbio_hifi/m64055e_200101_000000.hifi_reads.bam', '', 'Sequel II', hifi),
+        ('aAaBbb1_PacBio_HiFi_fastq_4', 'genomic_data/pacbio_hifi/m64055e_200101_000000.hifi_reads.fastq.gz', '', 'Sequel II', hifi),
+        ('aAaBbb1_PacBio_HiFi_bam_5', 'genomic_data/pacbio_hifi/m84091_240101_000000_s1.hifi_reads.bc2001.bam', '', 'Revio', hifi)]
+    assert summarize(get_transcriptome_metadata('Aa_bb', 'aAaBbb1', 'SAMN1')) == transcriptome
+    # Orphans are named relative to their folder; the lone_R1.fq.gz of the illumina folder is skipped by the .fastq.gz include.
+    assert capsys.readouterr().out.splitlines() == [
+        'Unpaired reads in %sgenomic_data/10X/: x_S1_L001_I1_001.fastq.gz' % (base),
+        'Unpaired reads in %stranscriptomic_data/brain_stem/illumina/: r3_R1_001.fastq.gz' % (base)]
+
+def test_every_platform_folder_after_a_submission(platform_folders):
+    submitted = SubmissionIndex()
+    submitted.add_row({'filename': base + 'genomic_data/arima/a_R1.fastq.gz', 'filename2': '', 'library_ID': 'aAaBbb1_HiC_3', 'platform': 'ILLUMINA'})
+    submitted.add_row({'filename': 'm64055e_200101_000000.hifi_reads.bam', 'library_ID': 'aAaBbb1_PacBio_HiFi_bam_2', 'platform': 'PACBIO_SMRT'})
+    submitted.add_row({'filename': 'i_L001_R1.fastq.gz', 'library_ID': 'aAaBbb1_Illumina_4', 'platform': 'ILLUMINA'})
+    assert summarize(get_genome_metadata('Aa_bb', 'aAaBbb1', 'SAMN1', submitted = submitted)) == [
+        ('aAaBbb1_10x_4', 'genomic_data/10X/x_S1_L001_R1_001.fastq.gz', 'x_S1_L001_R2_001.fastq.gz', novaseq, linked),
+        ('aAaBbb1_HiC_5', 'genomic_data/dovetail/d_1.fastq.gz', 'd_2.fastq.gz', novaseq, hic),
+        ('aAaBbb1_HiC_6', 'genomic_data/element/e_R1.fastq.gz', 'e_R2.fastq.gz', novaseq, hic),
+        ('aAaBbb1_Illumina_5', 'genomic_data/illumina/i_L002_R1.fastq.gz', 'i_L002_R2.fastq.gz', novaseq, shotgun),
+        ('aAaBbb1_PacBio_reads_3', 'genomic_data/pacbio_hifi/m1.reads.bam', '', 'Sequel II', 'Aa bb PacBio sequencing'),
+        ('aAaBbb1_PacBio_HiFi_5mC_bam_4', 'genomic_data/pacbio_hifi/m2.5mC.hifi_reads.with_5mC.bam', '', 'Sequel II', hifi),
+        ('aAaBbb1_PacBio_HiFi_subreads_5', 'genomic_data/pacbio_hifi/m54306Ue_1.subreads.bam', '', 'Sequel II', hifi),
+        ('aAaBbb1_PacBio_HiFi_fastq_2', 'genomic_data/pacbio_hifi/m64055e_200101_000000.hifi_reads.fastq.gz', '', 'Sequel II', hifi),
+        ('aAaBbb1_PacBio_HiFi_bam_6', 'genomic_data/pacbio_hifi/m84091_240101_000000_s1.hifi_reads.bc2001.bam', '', 'Revio', hifi)]
+    assert summarize(get_transcriptome_metadata('Aa_bb', 'aAaBbb1', 'SAMN1', submitted = submitted)) == transcriptome
+
+def compile_rule(rule):
+    return compile_rules({'genomic': {'rules': [rule]}}, metadata_dict, row_builders)
+
+def test_pattern_rule_needs_a_metadata_template():
+    with pytest.raises(ValueError, match = 'needs a metadata template'):
+        compile_rule({'pattern': '^hic_', 'builder': 'read_pairs', 'counter': ['HiC'], 'library_id': '{tolid}_{library}_{number}', 'title': '{title}'})
+    rule = compile_rule({'pattern': '^hic_', 'metadata': 'arima', 'builder': 'read_pairs', 'counter': ['HiC'],
+                         'library_id': '{tolid}_{library}_{number}', 'title': '{title}'})
+    assert rule.lookup('genomic', 'hic_v2').metadata('hic_v2') is metadata_dict['arima']
+
+def test_numbered_library_id_needs_a_counter():
+    with pytest.raises(ValueError, match = 'has no counter'):
+        compile_rule({'folders': ['arima'], 'builder': 'read_pairs', 'library_id': '{tolid}_{library}_{number}', 'title': '{title}'})
+    compile_rule({'folders': ['pacbio_hifi'], 'builder': 'pacbio_movies', 'library_id': '{tolid}_{library}_{number}', 'title': '{title}'})
@@ -0,0 +1,61 @@
+from sequence_files import classify_pacbio_file, pair_reads
+from generate_SRA_metadata import pacbio_instruments
+
+def test_chunked_reads_pair_on_the_r_token():
+    pairs, orphans = pair_reads(['s_R1_1.fastq.gz', 's_R1_2.fastq.gz', 's_R2_1.fastq.gz', 's_R2_2.fastq.gz'])
+    assert pairs == [('s_R1_1.fastq.gz', 's_R2_1.fastq.gz'), ('s_R1_2.fastq.gz', 's_R2_2.fastq.gz')]
+    assert orphans == []
+
+def test_lane_split_reads():
+    files = ['x_S1_L001_R1_001.fastq.gz', 'x_S1_L001_R2_001.fastq.gz', 'x_S1_L002_R1_001.fastq.gz', 'x_S1_L002_R2_001.fastq.gz']
+    pairs, orphans = pair_reads(files)
+    assert pairs == [(files[0], files[1]), (files[2], files[3])]
+    assert orphans == []
+
+def test_dotted_r_token():
+    pairs, orphans = pair_reads(['x.R2.fastq.gz', 'x.R1.fastq.gz'])
+    assert pairs == [('x.R1.fastq.gz', 'x.R2.fastq.gz')]
+
+def test_bare_read_numbers():
+    pairs, orphans = pair_reads(['x_1.fastq.gz', 'x_2.fastq.gz', 'y_1.fq.gz', 'y_2.fq.gz'])
+    assert pairs == [('x_1.fastq.gz', 'x_2.fastq.gz'), ('y_1.fq.gz', 'y_2.fq.gz')]
+
+def test_stem_containing_r1():
+    files = ['HiC_R1lib_R1.fastq.gz', 'HiC_R1lib_R2.fastq.gz', 'sampleR1_R1_001.fastq.gz', 'sampleR1_R2_001.fastq.gz']
+    pairs, orphans = pair_reads(files)
+    assert pairs == [(files[0], files[1]), (files[2], files[3])]
+    assert orphans == []
+
+def test_folders_are_not_read_tokens():
+    files = ['run_R1/x_1.fastq.gz', 'run_R1/x_2.fastq.gz']
+    assert pair_reads(files) == ([(files[0], files[1])], [])
+
+def test_10x_index_reads_are_orphans():
+    files = ['x_S1_L001_I1_001.fastq.gz', 'x_S1_L001_R1_001.fastq.gz', 'x_S1_L001_R2_001.fastq.gz']
+    pairs, orphans = pair_reads(files)
+    assert pairs == [(files[1], files[2])]
+    assert orphans == [files[0]]
+
+def test_missing_mate_and_non_reads():
+    pairs, orphans = pair_reads(['a_R1.fastq.gz', 'a.bam', 'notes.txt'])
+    assert pairs == []
+    assert orphans == ['a_R1.fastq.gz']
+
+def test_classify_pacbio_files():
+    cases = {
+        'm64055e_200101_000000.hifi_reads.bam': ('hifi_bam', 'm64055e_200101_000000', 'Sequel II', None),
+        'm84091_240101_000000_s1.hifi_reads.bc2001.bam': ('hifi_bam', 'm84091_240101_000000_s1', 'Revio', 'bc2001'),
+        'm84091_240101_000000_s1.hifi_reads.fastq.gz': ('fastq', 'm84091_240101_000000_s1', 'Revio', None),
+        'm54306Ue_1.ccs.bc1001--bc1001.bam': ('demultiplex_bam', 'm54306Ue_1', 'Sequel II', 'bc1001--bc1001'),
+        'm54306Ue_1.subreads.bam': ('subreads', 'm54306Ue_1', 'Sequel II', None),
+        'm1.reads.bam': ('reads', 'm1', 'Sequel II', None),
+        'm2.hifi_reads.with_5mC.bam': ('5mC', 'm2', 'Sequel II', None),
+    }
+    for filename, (filetype, tag, instrument, barcode) in cases.items():
+        classification = classify_pacbio_file(filename, pacbio_instruments)
+        assert (classification.filetype, classification.metadata_tag, classification.instrument, classification.barcode) == \
+            (filetype, tag, instrument, barcode), filename
+
+def test_unclassified_pacbio_files():
+    for filename in ['readme.txt', 'm1.bam.pbi', 'm1.fastq.gz', 'nodot']:
+        assert classify_pacbio_file(filename, pacbio_instruments) is None, filename
@@ -0,0 +1,13 @@
+from submissions import SubmissionIndex
+
+def test_bare_file_names_only_match_their_tolid():
+    submitted = SubmissionIndex()
+    submitted.add_row({'filename': 'x_R1.fastq.gz', 'filename2': 'x_R2.fastq.gz', 'library_ID': 'aA1_HiC_1', 'platform': 'ILLUMINA'})
+    assert submitted.is_submitted('species/A_b/aA1/genomic_data/arima/x_R1.fastq.gz', 'aA1')
+    assert not submitted.is_submitted('species/C_d/cC2/genomic_data/arima/x_R1.fastq.gz', 'cC2')
+
+def test_full_keys_match_exactly():
+    submitted = SubmissionIndex()
+    submitted.add_row({'filename': 'species/A_b/aA1/genomic_data/arima/x_R1.fastq.gz', 'library_ID': 'aA1_HiC_1', 'platform': 'ILLUMINA'})
+    assert submitted.is_submitted('species/A_b/aA1/genomic_data/arima/x_R1.fastq.gz', 'aA1')
+    assert not submitted.is_submitted('species/A_b/aA1/genomic_data/dovetail/x_R1.fastq.gz', 'aA1')
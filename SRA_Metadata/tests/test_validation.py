@@ -0,0 +1,50 @@
+import csv
+
+import batch_metadata
+import benchmark
+from journal import Journal
+from s3_listing import set_s3_client
+from validation import BatchValidator
+
+def orphan_only_batch(tmp_path):
+    set_s3_client(benchmark.StubS3Client([benchmark.synthetic_object('species/A_b/aA1/genomic_data/arima/aA1_R1.fastq.gz')]))
+    filename = str(tmp_path / 'batch.csv')
+    with open(filename, 'w', newline = '') as file:
+        writer = csv.DictWriter(file, fieldnames = ['ToLID', 'BioSample', 'Species'])
+        writer.writeheader()
+        writer.writerow({'ToLID': 'aA1', 'BioSample': 'SAMEA1', 'Species': 'A b'})
+    return filename
+
+def test_orphans_of_a_tolid_without_rows(tmp_path):
+    validator = BatchValidator()
+    batch_metadata.process_metadata(orphan_only_batch(tmp_path), True, False, output_dir = str(tmp_path / 'out'), validator = validator)
+    assert validator.tolids == {'aA1'}
+    assert validator.validate() == ['Unpaired reads in species/A_b/aA1/genomic_data/arima/: aA1_R1.fastq.gz']
+
+def test_resumed_passes_replay_orphans(tmp_path):
+    filename = orphan_only_batch(tmp_path)
+    journal_filename = str(tmp_path / 'out' / 'batch_journal.jsonl')
+    batch_metadata.process_metadata(filename, True, False, output_dir = str(tmp_path / 'out'), journal = Journal(journal_filename))
+    set_s3_client(benchmark.StubS3Client([]))
+    validator = BatchValidator()
+    batch_metadata.process_metadata(filename, True, False, output_dir = str(tmp_path / 'out'), journal = Journal(journal_filename, resume = True),
+                                  validator = validator)
+    assert validator.validate() == ['Unpaired reads in species/A_b/aA1/genomic_data/arima/: aA1_R1.fastq.gz']
+
+def library_row(library_ID, filename, filename2 = '', layout = 'single'):
+    return {'biosample_accession': 'SAMEA1', 'library_ID': library_ID, 'title': 'A b Iso-Seq', 'library_strategy': 'RNA-Seq',
+            'library_source': 'TRANSCRIPTOMIC', 'library_selection': 'PolyA', 'library_layout': layout, 'platform': 'PACBIO_SMRT',
+            'instrument_model': 'Revio', 'design_description': '', 'filename': filename, 'filename2': filename2}
+
+def test_library_id_reused_for_separate_files():
+    validator = BatchValidator()
+    validator.add_rows('aA1', [library_row('aA1_isoseq', 'aA1/liver/pacbio_hifi/m1.bam'), library_row('aA1_isoseq', 'aA1/liver/pacbio_hifi/m2.bam')])
+    assert validator.validate() == ['library_ID aA1_isoseq is used for both aA1/liver/pacbio_hifi/m1.bam and aA1/liver/pacbio_hifi/m2.bam']
+
+def test_library_id_shared_by_lanes_and_movie_files():
+    validator = BatchValidator()
+    validator.add_rows('aA1', [library_row('aA1_RNAseq_liver', 'aA1/liver/illumina/r_L001_R1.fastq.gz', 'aA1/liver/illumina/r_L001_R2.fastq.gz', 'paired'),
+                               library_row('aA1_RNAseq_liver', 'aA1/liver/illumina/r_L002_R1.fastq.gz', 'aA1/liver/illumina/r_L002_R2.fastq.gz', 'paired'),
+                               library_row('aA1_bam_1', 'aA1/pacbio_hifi/m1.hifi_reads.bc2001.bam'),
+                               library_row('aA1_bam_1', 'aA1/pacbio_hifi/m1.hifi_reads.bc2002.bam')])
+    assert validator.validate() == []
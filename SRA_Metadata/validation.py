@@ -0,0 +1,74 @@
+import os
+import threading
+
+from profiling import profiled
+
+# Rows that share a library_ID must describe the same library; only the files may differ.
+library_fields = ('biosample_accession', 'title', 'library_strategy', 'library_source', 'library_selection', 'library_layout',
+                  'platform', 'instrument_model', 'design_description')
+
+def library_group(row):
+    # Rows may only share a library_ID as lanes of one paired library in a folder, or as files of one PacBio movie.
+    directory, basename = os.path.split(row['filename'])
+    if row['library_layout'] == 'paired':
+        return directory, None
+    return directory, basename.split('.')[0]
+
+class BatchValidator:
+    def __init__(self):
+        self.paths = dict()
+        self.files = dict()
+        self.libraries = dict()
+        self.orphans = []
+        self.problems = []
+        self.tolids = set()
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    @profiled('validation')
+    def add_rows(self, tolid, rows, orphans = ()):
+        # A ToLID whose only reads are orphans produces no rows, but still counts and still fails validation.
+        with self._lock:
+            self.tolids.add(tolid)
+            self.orphans.extend(orphans)
+            for row in rows:
+                self._add_row(tolid, row)
+
+    def _add_row(self, tolid, row):
+        self.rows += 1
+        filenames = [row[column] for column in ('filename', 'filename2') if row[column]]
+        if len(set(filenames)) < len(filenames):
+            self.problems.append('Library %s lists %s as both reads' % (row['library_ID'], row['filename']))
+        for filename in dict.fromkeys(filenames):
+            if filename in self.paths:
+                self.problems.append('File %s is listed twice, in %s and %s' % (filename, self.paths[filename], row['library_ID']))
+                continue
+            self.paths[filename] = row['library_ID']
+            # Folders of one ToLID may reuse read file names, but the same file under two ToLIDs is almost always a copy.
+            basename = os.path.basename(filename)
+            first = self.files.setdefault(basename, (tolid, filename))
+            if first[0] != tolid:
+                self.problems.append('File %s appears under two ToLIDs: %s and %s' % (basename, first[1], filename))
+        if row['library_layout'] == 'paired' and len(filenames) < 2:
+            self.problems.append('Paired library %s has no second read file for %s' % (row['library_ID'], row['filename']))
+        attributes = tuple(row[column] for column in library_fields)
+        first = self.libraries.setdefault(row['library_ID'], (row['filename'], attributes, library_group(row)))
+        if first[1] != attributes:
+            differences = [column for column, first_value, value in zip(library_fields, first[1], attributes) if first_value != value]
+            self.problems.append('library_ID %s is shared by %s and %s, which differ in %s' % (row['library_ID'], first[0], row['filename'],
+                                                                                             ', '.join(differences)))
+        elif first[2] != library_group(row):
+            self.problems.append('library_ID %s is used for both %s and %s' % (row['library_ID'], first[0], row['filename']))
+
+    def validate(self):
+        problems = list(self.problems)
+        for location, orphans in self.orphans:
+            problems.append('Unpaired reads in %s: %s' % (location, ', '.join(orphans)))
+        return problems
+
+    def report(self):
+        problems = self.validate()
+        for problem in problems:
+            print(problem)
+        print('Validated %i rows from %i ToLIDs: %i problems' % (self.rows, len(self.tolids), len(problems)))
+        return not problems